@@ -1,53 +1,122 @@
+import io
 import os
+import sys
 import csv
+import json
 import math
-import random
+import bisect
+import heapq
+import queue
+import pickle
+import threading
+import subprocess
+import multiprocessing
 import numpy as np
-from PIL import Image
-import scipy.stats as stats
-from bitarray import bitarray
-import matplotlib.pyplot as plt
+from itertools import chain
 from collections import defaultdict
+# matplotlib and PIL are imported where they are used, so headless runs and pool workers start quickly
 
-random.seed()
 data_directory = "data"
 results_directory = "results"
 
 # * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * 
 
-def run_population_model(model):
-
-    free_params = setup_free_params(model)
-    chromosome_arm_data, free_params['numbits'] = load_chromosome_data(model["multiplier"])
-    death_risk = load_actuarial_table()
-    model_name = model["model_id"]
+def run_population_model(model, plotting=True):
 
+    tables = load_model_tables(model)
     print("Model parameters: ", model)
     print()
-    for run in range(1, model["num_runs"] + 1):
-        print ("Run ", run)
 
-        IndData = {}
-        chromosomes = {}
-        mutations = {}
-        mutation_hist = {i: 0 for i in range(-1000, 1001)}
+    # Every run gets its own random streams, spawned from the model's seed (fresh entropy if it is 0), so run n
+    # of a model is reproducible whether the runs are done one after another or in a pool
+    root_seed = np.random.SeedSequence(model["random_seed"] or None)
+    print("Random seed: ", root_seed.entropy)
+    run_seeds = root_seed.spawn(model["num_runs"])
+    if model["processes"] > 1 and model["num_runs"] > 1:
+        run_in_pool(model, tables, run_seeds)
+    else:
+        for run in range(1, model["num_runs"] + 1):
+            simulate_run(model, tables, run, run_seeds[run - 1], plotting)
+
+    if model["merge_runs"]:
+        merge_run_results(model)
+    print ('Done')
+
+# * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * *
+
+def load_model_tables(model):
+
+    # Read-only data shared by every run of a model
+    tables = {}
+    tables['chromosome_arm_data'], tables['numbits'] = load_chromosome_data(model["multiplier"])
+    recombination_rates = None
+    if model['recombination_map']:
+        recombination_rates = load_recombination_map(model['recombination_map'], model["multiplier"], tables['numbits'])
+    tables['crossovers'] = CrossoverGenerator(tables['chromosome_arm_data'], tables['numbits'], recombination_rates)
+    tables['chromosome_starts'] = tables['crossovers'].pstart
+    tables['death_risk'] = load_actuarial_table()
+    return tables
+
+# * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * *
+
+def simulate_run(model, tables, run, run_seed, plotting=True):
+
+    print ("Run ", run)
+    model_name = model["model_id"]
+    chromosome_arm_data, death_risk = tables['chromosome_arm_data'], tables['death_risk']
+    free_params = setup_free_params(model, run_seed)
+    free_params['output'] = OutputWriter()
+    free_params['numbits'] = tables['numbits']
+    free_params['crossovers'] = tables['crossovers']
+    free_params['chromosome_starts'] = tables['chromosome_starts']
+
+    IndData = PopulationStore()
+    chromosomes = GenomeStore(free_params['numbits'])
+    mutations = {}
+    mutation_hist = np.zeros(2001, dtype=np.int64)    # effects -1000..1000, offset by 1000
+    things_to_plot_during_run = setup_plot(model)
+    tracking = {'marriages': 0, 'births': 0, 'random_deaths': 0, 'cull_deaths': 0}
+    first_year, saved_events = 0, None
+    if model['resume_from']:
+        restored = load_checkpoint(model['resume_from'].format(run=run), model, run, IndData, chromosomes, mutations, free_params)
+        first_year, mutation_hist, saved_events = restored['year'] + 1, restored['mutation_hist'], restored['events']
+        if restored['resumed']:
+            tracking = restored['tracking']
+            for variable in things_to_plot_during_run:
+                things_to_plot_during_run[variable] = restored['plot'].get(variable, [math.nan] * len(restored['plot']['year']))
+            trim_output_files(model, run, restored['year'], IndData.living_ids())
+        else:
+            setup_output_files(model, run)
+    else:
         setup_output_files(model, run)
         initialize_population(IndData, model, free_params, chromosomes, mutations)
-        things_to_plot_during_run = setup_plot(model)
-        fig, ax1 = plt.subplots()
-        ax2 = ax1.twinx()
-        tracking = {'marriages': 0, 'births': 0, 'random_deaths': 0, 'cull_deaths': 0}
+    events = None
+    if model['engine'] == 'Event':
+        events = EventQueue(IndData, model, free_params, death_risk, first_year, saved_events)
+    dashboard = None
+    if plotting and (model['plot'] or model['plot_geography']):
+        dashboard = Dashboard(f"{model_name} run {run}", model['plot'], model['plot_geography'], things_to_plot_during_run)
 
-        for year in range(0, model["end_year"] + 1):
+    try:
+        for year in range(first_year, model["end_year"] + 1):
 
             if year == model["seed_year"]:
                 Innoculate_random_person(IndData, chromosomes, free_params)
-            babymommas, births = putemintheoven(IndData, year, model)
+                if events:
+                    events.seeded(IndData, free_params, year)
+            if events:
+                babymommas, births = events.conceptions(IndData, year, model)
+            else:
+                babymommas, births = putemintheoven(IndData, year, model, free_params)
             tracking['births'] += births
+            first_child = free_params['indID'] + 1
             mutation_hist = birth(IndData, model, free_params, babymommas, year, chromosomes, chromosome_arm_data, mutations, mutation_hist, free_params['numbits'])
             manlist, womanlist = list_availables(model, IndData, year)
-            tracking['marriages'] += setup_marriages(manlist, womanlist, IndData, model)
-            lifesucks, culled = BumpPeopleOff(IndData, chromosomes, mutations, model, free_params, death_risk, year, run)
+            tracking['marriages'] += setup_marriages(manlist, womanlist, IndData, model, free_params)
+            if events:
+                events.born(IndData, IndData.row_of[first_child:free_params['indID'] + 1], babymommas['mom'], year)
+                events.married(IndData, womanlist, year)
+            lifesucks, culled = BumpPeopleOff(IndData, chromosomes, mutations, model, free_params, death_risk, year, run, events)
             tracking['random_deaths'] += lifesucks
             tracking['cull_deaths'] += culled
 
@@ -57,29 +126,94 @@ def run_population_model(model):
                 # TO DO: save population data midrun if population goes extinct
 
             if year % model['save_interval'] == 0:
-                Save(run, year, IndData, chromosomes, model, free_params, tracking, things_to_plot_during_run, fig, ax1, ax2, mutations)
+                Save(run, year, IndData, chromosomes, model, free_params, tracking, things_to_plot_during_run, dashboard, mutations)
                 tracking = {'marriages': 0, 'births': 0, 'random_deaths': 0, 'cull_deaths': 0}
                 if model['track_DNA'] and model['every_genome_map']:
-                    save_population_genome_map(f"{model_name}-{year}", free_params['numbits'], IndData, chromosomes, chromosome_arm_data)
+                    save_population_genome_map(f"{model_name}-{year}", free_params['numbits'], IndData, chromosomes, chromosome_arm_data, model['map_max_rows'], model['downsample_maps'])
+                if model['track_DNA'] and model['genome_snapshots']:
+                    save_genome_snapshot(os.path.join(results_directory, f"{model_name}-{run} genomes"), year, IndData, chromosomes, free_params['output'])
             free_params['lastpopsize'] = len(IndData)
+            if model['checkpoint_interval'] and year % model['checkpoint_interval'] == 0:
+                filename = os.path.join(results_directory, f"{model_name}-{run} checkpoint.npz")
+                free_params['output'].flush()
+                save_checkpoint(filename, model, run, year, IndData, chromosomes, mutations, mutation_hist, free_params, tracking, things_to_plot_during_run, events)
 
         if model['track_mutations']:
             if model['mutation_hist']:
                 save_mutation_histogram(mutations, mutation_hist, model_name, run)
             if model['mutation_map']:
-                save_population_mutation_map(model_name, free_params['numbits'], IndData, mutations, chromosome_arm_data)
+                save_population_mutation_map(model_name, free_params['numbits'], IndData, mutations, chromosome_arm_data, model['map_max_rows'], model['downsample_maps'])
 
         if model['track_DNA'] and model['genome_map']:
-            save_population_genome_map(model_name, free_params['numbits'], IndData, chromosomes, chromosome_arm_data)
+            save_population_genome_map(model_name, free_params['numbits'], IndData, chromosomes, chromosome_arm_data, model['map_max_rows'], model['downsample_maps'])
 
         if model['track_dead']:
-            save_still_living_people(IndData, model['model_id'], model['end_year'], model['num_runs'])
+            save_still_living_people(IndData, model, model['end_year'], run, free_params['output'])
+    except BaseException:
+        # Everything saved up to the error still reaches the files, and the run's own error is the one reported
+        try:
+            free_params['output'].close()
+        except Exception:
+            pass
+        raise
+    else:
+        free_params['output'].close()
+    finally:
+        if dashboard:
+            dashboard.close()
+    if model['track_dead'] and model['death_log'] == 'Binary':
+        finish_death_log(os.path.join(results_directory, f"{model_name}-{run} deaths.npy"))
+    return run
 
-    print ('Done')
+# * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * *
+
+def run_in_pool(model, tables, run_seeds, start_method=None):
+
+    # Worker processes are forked where possible, so they share the parent's tables copy-on-write. Elsewhere they are
+    # spawned and import the main script, which must be guarded by if __name__ == "__main__". Workers do not plot.
+    methods = multiprocessing.get_all_start_methods()
+    context = multiprocessing.get_context(start_method or ('fork' if 'fork' in methods else None))
+    jobs = [(run, run_seeds[run - 1]) for run in range(1, model["num_runs"] + 1)]
+    with context.Pool(min(model["processes"], len(jobs)), initializer=set_pool_model, initargs=(model, tables)) as pool:
+        for run in pool.imap_unordered(pool_run, jobs):
+            print ("Run ", run, " finished")
+
+pool_model = {}
+
+def set_pool_model(model, tables):
+    pool_model['model'], pool_model['tables'] = model, tables
+
+def pool_run(job):
+    run, run_seed = job
+    return simulate_run(pool_model['model'], pool_model['tables'], run, run_seed, plotting=False)
+
+# * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * *
+
+def merge_run_results(model):
+
+    # Mean and standard deviation of every results column across runs, year by year
+    model_name = model["model_id"]
+    by_year = defaultdict(list)
+    for run in range(1, model["num_runs"] + 1):
+        filename = os.path.join(results_directory, f"{model_name}-{run} results.csv")
+        with open(filename, 'r', newline='') as file:
+            reader = csv.reader(file)
+            headers = next(reader)[2:]
+            for row in reader:
+                by_year[int(row[1])].append([float(value) for value in row[2:]])
+
+    filename = os.path.join(results_directory, f"{model_name} summary.csv")
+    with open(filename, 'w', newline='') as file:
+        writer = csv.writer(file)
+        writer.writerow(['year', 'runs'] + [f"{stat}_{header}" for header in headers for stat in ('mean', 'sd')])
+        for year in sorted(by_year):
+            values = np.array(by_year[year])
+            stats = np.column_stack((values.mean(axis=0), values.std(axis=0))).ravel()
+            writer.writerow([year, len(values)] + [round(value, 4) for value in stats.tolist()])
 
 # * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * *
 
-def Save(run, year, IndData, chromosomes, model, free_params, tracking, things_to_plot_during_run, fig, ax1, ax2, mutations):
+def Save(run, year, IndData, chromosomes, model, free_params, tracking, things_to_plot_during_run, dashboard, mutations):
 
     model_name = model["model_id"]
     filename = os.path.join(results_directory, f"{model_name}-{run} results.csv")
@@ -91,10 +225,19 @@ def Save(run, year, IndData, chromosomes, model, free_params, tracking, things_t
     perc_seed_genome_retained, av_seed_genome_coverage, av_heterozygosity = 0, 0, 0
     av_ind_fitness, av_bin_fitness, num_mutations, av_mutations_per_ind, av_mutations_per_bin = 0, 0, 0, 0, 0
 
+    if model["debug_stats"]:
+        IndData.stats.check(IndData, mutations if model["track_mutations"] else None)
+        IndData.cohorts.check(IndData)
+
     if model["track_DNA"] == 1:
         Y_descends, mt_descends, genealo_descends, genetic_descends, num_blocks, num_centromeres = calculate_misc_stats(IndData)
         tot_blocks, av_block_size, sd_block_size = calculate_block_stats(chromosomes)
-        perc_seed_genome_retained, av_seed_genome_coverage, av_heterozygosity = calculate_genetic_stats(chromosomes, free_params["numbits"], numinds)
+        if model["chromosome_stats"]:
+            perc_seed_genome_retained, av_seed_genome_coverage, av_heterozygosity, by_chromosome = calculate_genetic_stats(chromosomes, free_params["numbits"], numinds, free_params["chromosome_starts"])
+            rows = [[run, year, chrom] + values for chrom, values in enumerate(by_chromosome.tolist(), start=1)]
+            free_params['output'].writerows(os.path.join(results_directory, f"{model_name}-{run} chromosome_stats.csv"), rows)
+        else:
+            perc_seed_genome_retained, av_seed_genome_coverage, av_heterozygosity = calculate_genetic_stats(chromosomes, free_params["numbits"], numinds)
 
     if model["track_mutations"] == 1:
         av_ind_fitness, av_bin_fitness, num_mutations, av_mutations_per_ind, av_mutations_per_bin = calculate_fitness_stats(IndData, free_params["numbits"])
@@ -104,9 +247,8 @@ def Save(run, year, IndData, chromosomes, model, free_params, tracking, things_t
         av_mutations_per_bin = format(av_mutations_per_bin, '.1f')
 
     # Save current model status
-    with open(filename, mode='a', newline='') as results_file:
-        results_writer = csv.writer(results_file)
-        results_writer.writerow([run, year, numinds, tracking['marriages'], tracking['births'], tracking['random_deaths'], tracking['cull_deaths'], genetic_descends, genealo_descends, Y_descends, mt_descends, num_centromeres, tot_blocks, av_block_size, sd_block_size, av_ind_fitness, av_bin_fitness, num_mutations, av_mutations_per_ind, av_mutations_per_bin, perc_seed_genome_retained, av_seed_genome_coverage, av_heterozygosity])
+    free_params['output'].writerows(filename, [[run, year, numinds, tracking['marriages'], tracking['births'], tracking['random_deaths'], tracking['cull_deaths'], genetic_descends, genealo_descends, Y_descends, mt_descends, num_centromeres, tot_blocks, av_block_size, sd_block_size, av_ind_fitness, av_bin_fitness, num_mutations, av_mutations_per_ind, av_mutations_per_bin, perc_seed_genome_retained, av_seed_genome_coverage, av_heterozygosity]])
+    free_params['output'].sync()
 
     # Track progress on screen
     numinds = len(IndData)
@@ -118,65 +260,36 @@ def Save(run, year, IndData, chromosomes, model, free_params, tracking, things_t
 #    random_deaths = tracking['random_deaths']
 #    cull_deaths = tracking['cull_deaths']
 #    max_ID = free_params['indID']
+    point = {}
     for variable in model["plot"]:
         value = locals()[variable]
         things_to_plot_during_run[variable].append(value)
+        point[variable] = float(value)
     things_to_plot_during_run['year'].append(year)
+    if dashboard is None:
+        return
 
-    variables_to_skip = ['perc_seed_genome_retained', 'av_seed_genome_coverage', 'av_heterozygosity', 'av_fitness_per_ind', 'av_fitness_per_bin']     # these are generally not larger than 1.0, so they go on the second y axis
-    ax1.clear()
-    ax2.clear()
+    # The viewer process does the drawing; this only queues the new point
+    geography = None
+    if model['plot_geography']:
+        rows = IndData.living_rows()
+        rows = rows[::max(1, -(-len(rows) // DASHBOARD_MAX_PEOPLE))]
+        geography = np.column_stack((IndData.lat[rows], IndData.lon[rows])).astype(np.float32)
+    dashboard.send({'year': year, 'values': point, 'geography': geography})
 
-    for variable in model["plot"]:
-        if variable != 'year' and variable not in variables_to_skip:
-            ax1.plot(things_to_plot_during_run["year"], things_to_plot_during_run[variable], label=variable)
-    for variable in variables_to_skip:
-        if variable in things_to_plot_during_run:
-            ax2.plot(things_to_plot_during_run["year"], things_to_plot_during_run[variable], label=variable, linestyle='dashed')
-            ax2.legend(loc='upper right')
-    ax1.set_xlabel('Year')
-    ax1.legend(loc='upper left')
-    plt.draw()
-    plt.pause(0.1)
-
-    plot_geography = 0
-    if plot_geography == 1:
-        coordinates = [(ind['lat'], ind['lon']) for ind in IndData.values()]
-        latitudes, longitudes = zip(*coordinates)
-        plt.scatter(latitudes, longitudes, label='Individuals')
-        circle = plt.Circle((0, 0), 0.5, edgecolor='r', facecolor='none', linestyle='dashed')
-        plt.gca().add_patch(circle)
-        plt.xlim(-0.6, 0.6)
-        plt.ylim(-0.6, 0.6)
-        plt.xlabel('Latitude')
-        plt.ylabel('Longitude')
-        plt.title('Geographical Locations of Individuals')
-        plt.legend()
-        plt.draw()
-        plt.pause(0.1)
-    
 # * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * *
 
-def save_still_living_people (IndData, model_name, year, run):
+def save_still_living_people (IndData, model, year, run, output):
 
-    dead_people_data = ''
-    for ind in sorted(IndData.keys()):
-        dead_people_data += dead_string(ind, IndData, year)
-    filename = os.path.join(results_directory, f"{model_name}-{run} deaths.csv")
-    with open(filename, mode='a', newline='') as tracked_dead_file:
-        tracked_dead_file.write(dead_people_data)
+    write_death_records(output, model, run, dead_records(np.sort(IndData.living_ids()), IndData, year))
 
 # * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * *
 
 def save_mutation_histogram(mutations, mutation_hist, model_name, run):
 
-    circulating_mutations = {i: 0 for i in range(-1000, 1001)}
-    for ind in mutations:
-        for copy in range (2):
-            for position in range(len(mutations[ind][copy])):
-                fitness_list = mutations[ind][copy][position]
-                for fitness_effect in fitness_list:
-                    circulating_mutations[fitness_effect] += 1
+    effects = [haplotype[1] for ind in mutations for haplotype in mutations[ind]]
+    effects = np.concatenate(effects) if effects else np.empty(0, dtype=np.int32)
+    circulating_mutations = np.bincount(np.clip(effects, -1000, 1000) + 1000, minlength=2001)
 
     bins = np.arange(-1000, 1000 + 1, 1)
     filename = os.path.join(results_directory, f"{model_name}-{run} mutation_histogram.csv")
@@ -185,322 +298,510 @@ def save_mutation_histogram(mutations, mutation_hist, model_name, run):
         writer.writerow(['Bin', 'All_mutations', 'Circulating_mutations'])
         for bin in bins:
             adjusted_bin = bin / 1000
-            writer.writerow([adjusted_bin, mutation_hist[bin], circulating_mutations[bin]])
+            writer.writerow([adjusted_bin, mutation_hist[bin + 1000], circulating_mutations[bin + 1000]])
 
 # * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * *
 
-def save_population_genome_map(model_name, numbits, IndData, chromosomes, chromosome_arm_data):
+MAP_COLOURS = np.array([(0, 0, 0), (255, 0, 0), (255, 255, 255), (0, 255, 0)], dtype=np.uint8)
 
-    image_width = numbits
-    image_height = len(IndData) * 2 + 10
-    image = Image.new('RGB', (image_width, image_height), 'white')
-    pixels = image.load()
+def save_population_genome_map(model_name, numbits, IndData, chromosomes, chromosome_arm_data, max_rows=0, downsample=False):
 
-    for x in range(numbits):
-        for j in range(10):
-            pixels[x, j] = (255, 255, 255)
+    # One row per chromosome copy of every living person: red where the bin holds seed DNA, black elsewhere
+    ids = np.sort(IndData.living_ids()).tolist()    # oldest first
+    rows = chromosomes.rows(ids)
+    carriers = rows >= 0
+    haplotypes = np.zeros((len(ids), 2, chromosomes.nbytes), dtype=np.uint8)
+    haplotypes[carriers, 0] = chromosomes.haplotypes[rows[carriers]]
+    haplotypes[carriers, 1] = chromosomes.haplotypes[rows[carriers] + 1]
+    colours = np.unpackbits(haplotypes.reshape(2 * len(ids), chromosomes.nbytes), axis=1, count=numbits)
 
-    for chrom in range(1, len(chromosome_arm_data) + 1):
-#        pstart, plen = chromosome_arm_data[chrom][0]
-#        qstart, qlen = chromosome_arm_data[chrom][1]
-        pstart = chromosome_arm_data[chrom]['p']['start']
-        qstart = chromosome_arm_data[chrom]['q']['start']
-        qlen = chromosome_arm_data[chrom]['q']['length']
-        # draw telomere
-        for x in range(pstart, pstart + 3):
-            for j in range(10):
-               pixels[x, j] = (0, 255, 0)
-        # draw centromere
-        for x in range(qstart - 3, qstart + 3):
-            for j in range(10):
-                pixels[x, j] = (0, 0, 255)
-        # draw telomere
-        for x in range(qstart + qlen - 4, qstart + qlen - 1):
-            for j in range(10):
-                pixels[x, j] = (0, 255, 0)
-        # draw separator
-        for j in range(10):
-            pixels[qstart + qlen - 1, j] = (0, 0, 0)
-
-    row = 10
-    for ind in IndData:
-        if ind in chromosomes:
-            for copy in range (2):
-                chromosome = chromosomes[ind][copy]
-                for j in range(numbits):
-                    if chromosome[j]:
-                        pixels[j, row] = (255,0,0)
-                    else:
-                        pixels[j, row] = (0,0,0)
-                row += 1
-        else:
-            for copy in range (2):
-                for j in range(numbits):
-                   pixels[j, row] = (0,0,0)
-                row += 1
+    filename = os.path.join(results_directory, f"{model_name} genome_map")
+    save_map_image(chromosome_map_header(numbits, chromosome_arm_data), colours, filename, max_rows, downsample)
+
+# * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * *
+
+def save_population_mutation_map(model_name, image_width, IndData, mutations, chromosome_arm_data, max_rows=0, downsample=False):
+
+    # One row per chromosome copy of every living person: each bin holding mutations is coloured by their net
+    # effect (green beneficial, red deleterious, white neutral); bins without mutations stay black
+    ids = np.sort(IndData.living_ids()).tolist()    # oldest first
+    colours = np.zeros((2 * len(ids), image_width), dtype=np.uint8)
+    rows, positions, effects = [], [], []
+    for i, ind in enumerate(ids):
+        if ind in mutations:
+            for copy in range(2):
+                rows.append(np.full(len(mutations[ind][copy][0]), 2 * i + copy))
+                positions.append(mutations[ind][copy][0])
+                effects.append(mutations[ind][copy][1])
+    if rows:
+        bins, which = np.unique(np.concatenate(rows) * image_width + np.concatenate(positions), return_inverse=True)
+        net_effect = np.bincount(which, weights=np.concatenate(effects))
+        colours.flat[bins] = np.select([net_effect > 0, net_effect < 0], [3, 1], 2)
+
+    filename = os.path.join(results_directory, f"{model_name} mutation_map")
+    save_map_image(chromosome_map_header(image_width, chromosome_arm_data), colours, filename, max_rows, downsample)
+
+# * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * *
 
-    new_image_height = row
-    resized_image = image.resize((image_width, new_image_height))
-    filename = os.path.join(results_directory, f"{model_name} genome_map.png")
-    resized_image.save(filename, format='PNG')
+SNAPSHOT_PERSON = np.dtype([('ID', np.int64), ('carrier', np.bool_)])
+
+def create_genome_archive(directory):
+
+    # A directory of three append-only files: genomes.bin holds the two packed seed-tracking haplotypes of every
+    # carrier of seed DNA, people.bin every living person (in genome map order) with whether they are a carrier,
+    # and index.csv where each save year's people and carriers start in those files
+    os.makedirs(directory, exist_ok=True)
+    for name in ('genomes.bin', 'people.bin'):
+        open(os.path.join(directory, name), 'wb').close()
+    with open(os.path.join(directory, 'index.csv'), 'w', newline='') as file:
+        csv.writer(file).writerow(['year', 'people_start', 'people', 'carrier_start', 'carriers', 'numbits'])
+
+def save_genome_snapshot(directory, year, IndData, chromosomes, output):
+
+    ids = np.sort(IndData.living_ids())    # the row order of the genome map
+    rows = chromosomes.rows(ids.tolist())
+    carriers = rows >= 0
+    people = np.zeros(len(ids), dtype=SNAPSHOT_PERSON)
+    people['ID'], people['carrier'] = ids, carriers
+    copies = np.stack([rows[carriers], rows[carriers] + 1], axis=1).ravel()
+
+    if directory not in output.archives:
+        output.archives[directory] = GenomeArchive.sizes(directory)
+    index = output.archives[directory]
+    output.write(os.path.join(directory, 'genomes.bin'), chromosomes.haplotypes[copies].tobytes())
+    output.write(os.path.join(directory, 'people.bin'), people.tobytes())
+    output.writerows(os.path.join(directory, 'index.csv'), [[year, index['people'], len(ids), index['carriers'], int(carriers.sum()), chromosomes.numbits]])
+    index['people'] += len(ids)
+    index['carriers'] += int(carriers.sum())
 
 # * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * *
 
-def save_population_mutation_map(model_name, image_width, IndData, mutations, chromosome_arm_data):
+def chromosome_map_header(image_width, chromosome_arm_data):
 
-    image_height = len(IndData) * 2 + 10
-    image = Image.new('RGB', (image_width, image_height), 'white')
-    pixels = image.load()
+    header = np.full((10, image_width, 3), 255, dtype=np.uint8)
     for chrom in range(1, len(chromosome_arm_data) + 1):
-#        pstart, plen = chromosome_arm_data[chrom][0]
-#        qstart, qlen = chromosome_arm_data[chrom][1]
         pstart = chromosome_arm_data[chrom]['p']['start']
         qstart = chromosome_arm_data[chrom]['q']['start']
         qlen = chromosome_arm_data[chrom]['q']['length']
-        # draw telomere
-        for x in range(pstart, pstart + 3):
-            for j in range(10):
-               pixels[x, j] = (0, 255, 0)
-        # draw centromere
-        for x in range(qstart - 3, qstart + 3):
-            for j in range(10):
-                pixels[x, j] = (0, 0, 255)
-        # draw telomere
-        for x in range(qstart + qlen - 4, qstart + qlen - 1):
-            for j in range(10):
-                pixels[x, j] = (0, 255, 0)
-        # draw separator
-        for j in range(10):
-            pixels[qstart + qlen - 1, j] = (0, 0, 0)
-
-    row = 10
-    for ind in IndData:
-        if ind in mutations:
-            for copy in range (2):
-                for j in range(image_width):
-                    fitness, mutation_count = get_bin_fitness(ind, copy, j, mutations)
-                    if mutation_count == 0:
-                        pixels[j, row] = (0,0,0)
-                    else:
-                        if fitness == 1:
-                            pixels[j, row] = (255,255,255)
-                        if fitness > 1:
-                            pixels[j, row] = (0,255,0)
-                        if fitness < 1:
-                            pixels[j, row] = (255,0,0)
-                row += 1
+        header[:, pstart:pstart + 3] = (0, 255, 0)                       # telomere
+        header[:, qstart - 3:qstart + 3] = (0, 0, 255)                   # centromere
+        header[:, qstart + qlen - 4:qstart + qlen - 1] = (0, 255, 0)     # telomere
+        header[:, qstart + qlen - 1] = (0, 0, 0)                         # separator
+    return header
+
+# * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * *
+
+def save_map_image(header, colours, filename, max_rows=0, downsample=False):
+
+    # colours holds an index into MAP_COLOURS for every pixel, two rows per person. Maps taller than max_rows are
+    # either thinned to every n-th person or split into numbered tiles, each with its own header.
+    from PIL import Image
+    if max_rows > 0 and len(colours) > max_rows:
+        if downsample:
+            step = math.ceil(len(colours) / max_rows)
+            colours = colours.reshape(-1, 2, colours.shape[1])[::step].reshape(-1, colours.shape[1])
         else:
-            for copy in range (2):
-                for j in range(image_width):
-                   pixels[j, row] = (0,0,0)
-                row += 1
+            tile_rows = max(2, max_rows - max_rows % 2)
+            for tile, start in enumerate(range(0, len(colours), tile_rows), start=1):
+                image = Image.fromarray(np.concatenate([header, MAP_COLOURS[colours[start:start + tile_rows]]]))
+                image.save(f"{filename}-{tile}.png", format='PNG')
+            return
+    image = Image.fromarray(np.concatenate([header, MAP_COLOURS[colours]]))
+    image.save(f"{filename}.png", format='PNG')
+
+# * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * *
 
-    filename = os.path.join(results_directory, f"{model_name} mutation_map.png")
-    image.save(filename, format='PNG')
+def save_checkpoint(filename, model, run, year, IndData, chromosomes, mutations, mutation_hist, free_params, tracking, things_to_plot_during_run, events):
+
+    # Everything the year loop needs to carry on after this year, in one npz: the population columns and the packed
+    # genome matrix as they are, the mutation lists flattened into one array per field, and the scalars and random
+    # stream states as a JSON string. Written to a temporary file first, so a crash never leaves a broken checkpoint.
+    arrays = {'ind_' + name: getattr(IndData, name) for name in PopulationStore.columns}
+    arrays['ind_alive'] = IndData.alive
+    arrays['ind_row_of'] = IndData.row_of
+    arrays['ind_free_rows'] = np.array(IndData.free_rows, dtype=np.int64)
+    arrays['genome_ids'] = np.array(list(chromosomes.row_of.keys()), dtype=np.int64)
+    arrays['genome_rows'] = np.array(list(chromosomes.row_of.values()), dtype=np.int64)
+    arrays['genome_free_rows'] = np.array(chromosomes.free_rows, dtype=np.int64)
+    arrays['genome_haplotypes'] = chromosomes.haplotypes
+    arrays['genome_block_hist'] = chromosomes.block_hist
+
+    haplotypes = [mutations[ind][copy] for ind in mutations for copy in range(2)]
+    arrays['mutation_ids'] = np.array(list(mutations), dtype=np.int64)
+    arrays['mutation_sizes'] = np.array([len(positions) for positions, effects in haplotypes], dtype=np.int64)
+    arrays['mutation_positions'] = np.concatenate([positions for positions, effects in haplotypes] + [new_haplotype()[0]])
+    arrays['mutation_effects'] = np.concatenate([effects for positions, effects in haplotypes] + [new_haplotype()[1]])
+    arrays['mutation_hist'] = mutation_hist
+
+    rng = free_params['rng']
+    buffers = dict(rng.buffers, weibull=free_params['mutation_effects'].weibull)
+    buffer_states = {}
+    for name, buffer in buffers.items():
+        arrays['rng_' + name], buffer_states[name] = buffer.saved()
+    if events:
+        arrays.update(events.saved())
+
+    state = {'model_id': model['model_id'], 'run': run, 'year': year, 'numbits': free_params['numbits'],
+             'track_DNA': model['track_DNA'], 'track_mutations': model['track_mutations'],
+             'engine': model['engine'], 'model': model,
+             'free_params': {key: free_params[key] for key in ('indID', 'lastpopsize', 'mutID', 'seed')},
+             'ind_capacity': IndData.capacity, 'ind_size': IndData.size, 'genome_capacity': chromosomes.capacity,
+             'stats': IndData.stats.totals, 'max_lifespan': IndData.cohorts.max_lifespan,
+             'rng': {phase: getattr(rng, phase).bit_generator.state for phase in rng.phases}, 'buffers': buffer_states,
+             'tracking': tracking, 'plot': things_to_plot_during_run}
+    arrays['state'] = np.array(json.dumps(state, default=lambda value: value.item()))
+
+    temporary = filename + '.tmp'
+    with open(temporary, 'wb') as file:
+        np.savez_compressed(file, **arrays)
+    os.replace(temporary, filename)
 
 # * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * *
 
-def get_bin_fitness(ind, copy, position, mutations):
-    fitness_list = mutations[ind][copy][position]
-    fitness = 1
-    mutation_count = len(fitness_list)
-    for j in range(mutation_count):
-        fitness += fitness_list[j] / 1000
-    return fitness, mutation_count
+def load_checkpoint(filename, model, run, IndData, chromosomes, mutations, free_params):
+
+    # Fills the empty stores of a new run from a checkpoint. A checkpoint of the same model and run is resumed
+    # exactly, random streams included. Any other model forks from it: the population carries on with this model's
+    # parameters and its own random streams, so many scenarios can branch from one burn-in.
+    with np.load(filename) as data:
+        state = json.loads(str(data['state']))
+        for key in ('numbits', 'track_DNA', 'track_mutations'):
+            mine = free_params['numbits'] if key == 'numbits' else model[key]
+            if state[key] != mine:
+                raise ValueError(f"Checkpoint {filename} has {key} = {state[key]}, but this model has {mine}")
+        resumed = state['model_id'] == model['model_id'] and state['run'] == run
+
+        IndData.grow(state['ind_capacity'])
+        for name in PopulationStore.columns:
+            setattr(IndData, name, data['ind_' + name])
+        IndData.alive = data['ind_alive']
+        IndData.row_of = data['ind_row_of']
+        IndData.free_rows = data['ind_free_rows'].tolist()
+        IndData.size = state['ind_size']
+        IndData.stats.totals = state['stats']
+        IndData.cohorts.add(IndData, IndData.living_rows())
+        IndData.cohorts.max_lifespan = state['max_lifespan']
+
+        chromosomes.grow(state['genome_capacity'])
+        chromosomes.haplotypes = data['genome_haplotypes']
+        chromosomes.row_of = dict(zip(data['genome_ids'].tolist(), data['genome_rows'].tolist()))
+        chromosomes.free_rows = data['genome_free_rows'].tolist()
+        chromosomes.block_hist = data['genome_block_hist']
+
+        sizes = data['mutation_sizes']
+        positions = np.split(data['mutation_positions'], np.cumsum(sizes)[:-1]) if len(sizes) else []
+        effects = np.split(data['mutation_effects'], np.cumsum(sizes)[:-1]) if len(sizes) else []
+        for i, ind in enumerate(data['mutation_ids'].tolist()):
+            mutations[ind] = [(positions[2 * i], effects[2 * i]), (positions[2 * i + 1], effects[2 * i + 1])]
+
+        free_params.update(state['free_params'])
+        events = None
+        if resumed:
+            rng = free_params['rng']
+            for phase in rng.phases:
+                getattr(rng, phase).bit_generator.state = state['rng'][phase]
+            buffers = dict(rng.buffers, weibull=free_params['mutation_effects'].weibull)
+            for name, buffer in buffers.items():
+                buffer.restore(data['rng_' + name], state['buffers'][name])
+            if state['engine'] == model['engine'] == 'Event':
+                events = {key: data[key] for key in ('event_keys', 'event_sizes', 'event_ids', 'event_ready')}
+
+        return {'year': state['year'], 'resumed': resumed, 'mutation_hist': data['mutation_hist'], 'events': events,
+                'tracking': state['tracking'], 'plot': state['plot']}
+
+# * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * *
+
+def trim_output_files(model, run, year, living):
+
+    # A resumed run picks up its own output files, less any rows written after the checkpoint. That includes the
+    # people still living at the end of an earlier run, who were written to the death log as if they died then.
+    model_name = model['model_id']
+    living_ids = set(str(ind) for ind in living.tolist())
+    files = [('results', 1), ('chromosome_stats', 1), ('deaths', 2)]    # file, column holding the year
+    for name, column in files:
+        filename = os.path.join(results_directory, f"{model_name}-{run} {name}.csv")
+        if os.path.exists(filename):
+            with open(filename, newline='') as file:
+                lines = file.readlines()
+            kept = lines[:1]
+            for line in lines[1:]:
+                fields = line.split(',')
+                if int(fields[column]) < year or (int(fields[column]) == year and not (name == 'deaths' and fields[0] in living_ids)):
+                    kept.append(line)
+            with open(filename, 'w', newline='') as file:
+                file.writelines(kept)
+
+    filename = os.path.join(results_directory, f"{model_name}-{run} deaths.npy")
+    if os.path.exists(filename):
+        records = open_death_log(filename)
+        deathyear = records['deathyear']
+        kept = np.asarray(records[(deathyear < year) | ((deathyear == year) & ~np.isin(records['ID'], living))])
+        del records, deathyear
+        create_death_log(filename, kept)
+
+    directory = os.path.join(results_directory, f"{model_name}-{run} genomes")
+    if os.path.exists(directory):
+        with open(os.path.join(directory, 'index.csv'), newline='') as file:
+            lines = file.readlines()
+        lines = lines[:1] + [line for line in lines[1:] if int(line.split(',')[0]) <= year]
+        with open(os.path.join(directory, 'index.csv'), 'w', newline='') as file:
+            file.writelines(lines)
+        sizes = GenomeArchive.sizes(directory)
+        numbits = int(lines[-1].split(',')[5]) if len(lines) > 1 else 0
+        for name, size in (('genomes.bin', sizes['carriers'] * 2 * ((numbits + 7) // 8)), ('people.bin', sizes['people'] * SNAPSHOT_PERSON.itemsize)):
+            with open(os.path.join(directory, name), 'r+b') as file:
+                file.truncate(size)
 
 # * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * *
 
 def list_availables(model, IndData, year):
 
-    grooms = []
-    brides = []
-    for ind in IndData:
-        married = IndData[ind]["marriage_state"]
-        if married == -1:
-            age = year - IndData[ind]["birth_year"]
-            if age > model["maturity"]:
-                sex = IndData[ind]["sex"]
-                lifespan  = IndData[ind]["lifespan"]
-                if sex == 0:
-                    grooms.append(ind)
-                elif age < lifespan * model["menopause"]:    # Old ladies don't remarry
-                    brides.append(ind)
+    # Only single men and women past maturity, and no women born too early to be under the menopause age
+    youngest = year - model["maturity"]
+    oldest = math.floor(year - IndData.cohorts.max_lifespan * model["menopause"]) - 1
+    rows = np.sort(np.concatenate((IndData.cohorts.rows(0, 0, born_before=youngest),
+                                   IndData.cohorts.rows(1, 0, born_after=oldest, born_before=youngest))))
+    age = year - IndData.birth_year[rows]
+    single = (IndData.marriage_state[rows] == -1) & (age > model["maturity"])
+    men = IndData.sex[rows] == 0
+    fertile = age < IndData.lifespan[rows] * model["menopause"]    # Old ladies don't remarry
+    grooms = IndData.ID[rows[single & men]]
+    brides = IndData.ID[rows[single & ~men & fertile]]
 
     return grooms, brides
 
 # * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * 
 
-def putemintheoven(IndData, year, model):
-
-    pregnant_couples = []
-    for ind in IndData:
-        sex      = IndData[ind]["sex"]
-        married  = IndData[ind]["marriage_state"]
-        age      = year - IndData[ind]["birth_year"]
-        lifespan = IndData[ind]["lifespan"]
-        if sex == 1 and married > -1 and age < lifespan * model["menopause"]:
-            if IndData[ind]["year_of_last_birth"] + model["spacing"] <= year:
-                if random.randint(0, model["birth_prob"] - 1) == 0:
-                    mom = ind
-                    dad = married
-                    fitness = 1
-                    if model["track_mutations"] == 1 and model["selection"] == "birth":
-                        fitness = (IndData[dad]["fitness"] + IndData[mom]["fitness"]) / 2
-                    chance = random.random()
-                    if chance < fitness:
-                        b = {'dad': dad, 'mom': mom}
-                        pregnant_couples.append(b)
-
-    return pregnant_couples, len(pregnant_couples)
+def putemintheoven(IndData, year, model, free_params):
+
+    oldest = math.floor(year - IndData.cohorts.max_lifespan * model["menopause"]) - 1
+    rows = IndData.cohorts.rows(1, 1, born_after=oldest)
+    age = year - IndData.birth_year[rows]
+    wives = rows[(IndData.sex[rows] == 1) & (IndData.marriage_state[rows] > -1) & (age < IndData.lifespan[rows] * model["menopause"])]
+    wives = wives[IndData.year_of_last_birth[wives] + model["spacing"] <= year]
+    wives = wives[free_params['rng'].mating.integers(0, model["birth_prob"], len(wives)) == 0]
+
+    moms = IndData.ID[wives]
+    dads = IndData.marriage_state[wives]
+    fitness = np.ones(len(wives))
+    if model["track_mutations"] == 1 and model["selection"] == "birth":
+        fitness = (IndData.fitness[IndData.row_of[dads]] + IndData.fitness[wives]) / 2
+    conceived = free_params['rng'].uniform('mating', len(wives)) < fitness
+    pregnant_couples = {'dad': dads[conceived], 'mom': moms[conceived]}
+
+    return pregnant_couples, len(pregnant_couples['mom'])
 
 # * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * 
 
-def create_child(year, IndData, dad, mom, child, model):
+def create_child(year, IndData, dad, mom, child, sex, model):
 
-    life = int((IndData[dad]['lifespan'] + IndData[mom]['lifespan']) / 2 * model['lifespan_drop'])
+    d, m = IndData.row_of[dad], IndData.row_of[mom]
+    life = int((IndData.lifespan[d] + IndData.lifespan[m]) / 2 * model['lifespan_drop'])
     if life < model['min_lifespan']:
         life = model['min_lifespan']
 
-    IndData[child] = {
-        'dad': dad,
-        'mom': mom,
-        'sex': random.randint(0, 1),
-        'birth_year': year,
-        'lifespan': life,
-        'fitness': 1,
-        'marriage_state': -1,
-        'lat': round((IndData[dad]['lat'] + IndData[mom]['lat']) / 2, 2),
-        'lon': round((IndData[dad]['lon'] + IndData[mom]['lon']) / 2, 2)
-    }
-
-    IndData[mom]['year_of_last_birth'] = year
-    if 'numbirths' not in IndData[mom]:
-        IndData[mom]['numbirths'] = 0
-    IndData[mom]['numbirths'] += 1
+    IndData.add(child,
+        dad = dad,
+        mom = mom,
+        sex = sex,
+        birth_year = year,
+        lifespan = life,
+        fitness = 1,
+        marriage_state = -1,
+        lat = round((IndData.lat[d] + IndData.lat[m]) / 2, 2),
+        lon = round((IndData.lon[d] + IndData.lon[m]) / 2, 2)
+    )
+
+    IndData.year_of_last_birth[m] = year
+    IndData.numbirths[m] = max(IndData.numbirths[m], 0) + 1    # -1 until the first birth
 
 # * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * *
 
-def createmask (sex, free_params, chromosome_arm_data):
-
-    mask  = bitarray(free_params["numbits"])
-    cents = bitarray(len(chromosome_arm_data) + 1)
-    mask.setall(0)
-    cents.setall(0)
-    for chrom in range(1, len(chromosome_arm_data) + 1):
-        pstart = chromosome_arm_data[chrom]['p']['start']
-        qstart = chromosome_arm_data[chrom]['q']['start']
-        plen = chromosome_arm_data[chrom]['p']['length']
-        qlen = chromosome_arm_data[chrom]['q']['length']
-        ploc = random.randint(0, plen - 1)
-        qloc = random.randint(0, qlen - 1)
-        which_copy = random.randint(0, 1)
-        if which_copy:
-            mask[pstart + ploc:qstart + qloc] = True
-        else:
-            mask[pstart:pstart + ploc] = True
-            mask[qstart + qloc:qstart + qlen] = True
-            cents[chrom] = 1
-
-    if sex == 0:
-        xstart = chromosome_arm_data[23]['p']['start']
-        xend =  chromosome_arm_data[23]['q']['start'] +  chromosome_arm_data[23]['q']['length']
-        mask[xstart:xend] = False    
-
-    return mask, cents
+class CrossoverGenerator:
+
+    # Crossover masks, breakpoints and centromere choices for every parent in a birth cohort at once. One crossover
+    # per chromosome arm, placed uniformly or, given a recombination map, in proportion to the per-bin rates.
+    def __init__(self, chromosome_arm_data, numbits, recombination_rates=None):
+        chroms = range(1, len(chromosome_arm_data) + 1)
+        self.numbits = numbits
+        self.num_chroms = len(chromosome_arm_data)
+        self.pstart = np.array([chromosome_arm_data[chrom]['p']['start'] for chrom in chroms], dtype=np.int64)
+        self.plen = np.array([chromosome_arm_data[chrom]['p']['length'] for chrom in chroms], dtype=np.int64)
+        self.qstart = np.array([chromosome_arm_data[chrom]['q']['start'] for chrom in chroms], dtype=np.int64)
+        self.qlen = np.array([chromosome_arm_data[chrom]['q']['length'] for chrom in chroms], dtype=np.int64)
+        self.x_chrom = self.num_chroms - 1
+        if recombination_rates is None:
+            recombination_rates = np.ones(numbits)
+        self.cumulative_rate = np.cumsum(recombination_rates, dtype=np.float64)
+
+    def locate(self, starts, lengths, u):
+        # Offset of the crossover within each arm, by inverting the cumulative rate over the arm
+        before = np.where(starts > 0, self.cumulative_rate[starts - 1], 0)
+        total = self.cumulative_rate[starts + lengths - 1] - before
+        positions = np.searchsorted(self.cumulative_rate, before + u * total, side='right')
+        return np.minimum(positions, starts + lengths - 1) - starts
+
+    def draw(self, num_parents, sex, rng, with_masks=True):
+        n, k = num_parents, self.num_chroms
+        ploc = self.locate(self.pstart, self.plen, rng.uniform('meiosis', n * k).reshape(n, k))
+        qloc = self.locate(self.qstart, self.qlen, rng.uniform('meiosis', n * k).reshape(n, k))
+        which_copy = rng.meiosis.integers(0, 2, (n, k))
+        cents = np.zeros((n, k + 1), dtype=bool)
+        cents[:, 1:] = which_copy == 0
+
+        # Three runs per chromosome: p arm up to the crossover, crossover to crossover, q arm after the crossover
+        pstart, qend = np.broadcast_to(self.pstart, ploc.shape), np.broadcast_to(self.qstart + self.qlen, qloc.shape)
+        starts = np.stack([pstart, self.pstart + ploc, self.qstart + qloc], axis=2)
+        ends = np.stack([self.pstart + ploc, self.qstart + qloc, qend], axis=2)
+        copies = np.stack([1 - which_copy, which_copy, 1 - which_copy], axis=2)
+        if sex == 0:    # fathers pass on their X unrecombined
+            xstart, xend = self.pstart[self.x_chrom], self.qstart[self.x_chrom] + self.qlen[self.x_chrom]
+            starts[:, self.x_chrom] = [xstart, xend, xend]
+            ends[:, self.x_chrom] = xend
+            copies[:, self.x_chrom] = 0
+        breakpoints = np.stack([starts.reshape(n, 3 * k), ends.reshape(n, 3 * k), copies.reshape(n, 3 * k)], axis=1)
+
+        masks = None
+        if with_masks:
+            parent, run = np.nonzero(copies.reshape(n, 3 * k))
+            edges = np.zeros((n, self.numbits + 1), dtype=np.int8)
+            np.add.at(edges, (parent, breakpoints[parent, 0, run]), 1)
+            np.add.at(edges, (parent, breakpoints[parent, 1, run]), -1)
+            masks = np.packbits(np.cumsum(edges[:, :-1], axis=1, dtype=np.int8) > 0, axis=1)
+        return masks, cents, breakpoints
 
 # * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * 
 
-def meiosis(parent, child, chromosomes, mask, copy):
-    parent_copy_0 = bitarray(len(mask))
-    parent_copy_1 = bitarray(len(mask))
-    child_copy = bitarray(len(mask))
-    parent_copy_0.setall(0)
-    parent_copy_1.setall(0)
-    child_copy.setall(0)
-    if len(chromosomes[parent][0]) == len(mask):
-        parent_copy_0 = chromosomes[parent][0]
-    if len(chromosomes[parent][1]) == len(mask):
-        parent_copy_1 = chromosomes[parent][1]
-    child_copy = (mask & parent_copy_0) | (~mask & parent_copy_1)
-    chromosomes[child][copy] = child_copy
+def meiosis(parents, masks, chromosomes):
+
+    # One child copy per row of masks, for a whole birth cohort at once: bins come from the parent's
+    # copy 0 where the mask is set and from copy 1 elsewhere. Parents without seed DNA pass on zeros.
+    rows = chromosomes.rows(parents)
+    carriers = rows > -1
+    parent_copy_0 = np.zeros_like(masks)
+    parent_copy_1 = np.zeros_like(masks)
+    parent_copy_0[carriers] = chromosomes.haplotypes[rows[carriers]]
+    parent_copy_1[carriers] = chromosomes.haplotypes[rows[carriers] + 1]
+    child_copy = (masks & parent_copy_0) | (~masks & parent_copy_1)
+    return child_copy
 
 # * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * 
 
-def count_alleles (ind, chromosomes):
+def count_alleles (copy_0, copy_1):
 
-    allele_count = 0
-    allele_count = chromosomes[ind][0].count(True)
-    allele_count += chromosomes[ind][1].count(True)
+    allele_count = POPCOUNT[copy_0].sum(axis=-1, dtype=np.int64)
+    allele_count += POPCOUNT[copy_1].sum(axis=-1, dtype=np.int64)
     return allele_count
 
 # * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * 
 
 def inherit_centromeres (cents1, cents2, IndData, dad, mom, child, chromosome_arm_data):
 
-    def update_child_centromeres(IndData, child, parent, chromosome_arm_data, offset, cents):
-        for chrom in range(1, len(chromosome_arm_data) + 1):
-            if cents[chrom] == 0:
-                IndData[child]['centromeres'][chrom * 2 + offset] = IndData[parent]['centromeres'][chrom * 2]
-            else:
-                IndData[child]['centromeres'][chrom * 2 + offset] = IndData[parent]['centromeres'][chrom * 2 + 1]
+    def update_child_centromeres(IndData, c, p, chromosome_arm_data, offset, cents):
+        chroms = np.arange(1, len(chromosome_arm_data) + 1)
+        which_copy = cents[chroms].astype(np.int64)
+        IndData.centromeres[c, chroms * 2 + offset] = IndData.centromeres[p, chroms * 2 + which_copy]
 
-    if 'centromeres' in IndData[dad] or 'centromeres' in IndData[mom]:
-        IndData[child]['centromeres'] = bitarray(48)
-        IndData[child]['centromeres'].setall(0)
-        if 'centromeres' in IndData[dad]:
-            update_child_centromeres(IndData, child, dad, chromosome_arm_data, 0, cents1)
-        if 'centromeres' in IndData[mom]:
-            update_child_centromeres(IndData, child, mom, chromosome_arm_data, 1, cents2)
+    c, d, m = IndData.row_of[child], IndData.row_of[dad], IndData.row_of[mom]
+    if IndData.has_centromeres[d] or IndData.has_centromeres[m]:
+        IndData.has_centromeres[c] = True
+        if IndData.has_centromeres[d]:
+            update_child_centromeres(IndData, c, d, chromosome_arm_data, 0, cents1)
+        if IndData.has_centromeres[m]:
+            update_child_centromeres(IndData, c, m, chromosome_arm_data, 1, cents2)
 
 # * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * 
 
-def inherit_mutations(mask1, mask2, dad, mom, child, mutations, numbits):
+def new_haplotype():
 
-    mutations[child][0] = [mutations[dad][int(mask1[i])][i] for i in range(numbits)]
-    mutations[child][1] = [mutations[mom][int(mask2[i])][i] for i in range(numbits)]
-    return mutations
+    # Mutations on one chromosome copy, as parallel arrays sorted by position: (positions, fitness effects x 1000)
+    return np.empty(0, dtype=np.int32), np.empty(0, dtype=np.int32)
 
 # * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * 
 
-def generate_new_mutations(ind, model, free_params, mutations, mutation_hist):
+def inherit_mutations(breakpoints1, breakpoints2, dad, mom, child, mutations):
+
+    # Splice the child's copy together from whole runs of the parent's mutations, one run per segment.
+    # The segments are in genome order, so the result is already sorted by position. The summed effect
+    # of the inherited runs is tallied on the way, so the child's fitness never needs a rescan.
+    def inherit_haplotype(parent, breakpoints):
+        starts, ends, copies = breakpoints
+        positions = np.concatenate((mutations[parent][0][0], mutations[parent][1][0]))
+        effects = np.concatenate((mutations[parent][0][1], mutations[parent][1][1]))
+        offset = np.where(copies == 1, len(mutations[parent][0][0]), 0)
+        first = offset + np.where(copies == 1, np.searchsorted(mutations[parent][1][0], starts), np.searchsorted(mutations[parent][0][0], starts))
+        last = offset + np.where(copies == 1, np.searchsorted(mutations[parent][1][0], ends), np.searchsorted(mutations[parent][0][0], ends))
+        run_lengths = last - first
+        index = np.repeat(first - np.cumsum(run_lengths) + run_lengths, run_lengths) + np.arange(run_lengths.sum())
+        return positions[index], effects[index]
+
+    mutations[child] = [inherit_haplotype(dad, breakpoints1), inherit_haplotype(mom, breakpoints2)]
+    mutation_count = len(mutations[child][0][1]) + len(mutations[child][1][1])
+    total_effect = int(mutations[child][0][1].sum()) + int(mutations[child][1][1].sum())
+    return mutations, mutation_count, total_effect
+
+# * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * 
 
-    def get_mutation_effect(model):
-        mutation_effect = 0
-        is_mutation_non_neutral = random.random()
-        if is_mutation_non_neutral >= model['f_neutral']:
-            mutation_effect = stats.weibull_min.rvs(model['shape'], scale=model['scale'])
-            mutation_effect = mutation_effect / model['Weibull_adj']
-            is_mutation_deleterious = random.random()
-            if is_mutation_deleterious > model['f_beneficial']:
-                mutation_effect = -mutation_effect
-        return mutation_effect
+def generate_new_mutations(num_children, model, free_params, mutation_hist):
 
+    # Draw the new mutations for a whole birth cohort at once: how many each child gets,
+    # and where, on which copy and with what effect each one lands
     numbits = free_params['numbits']
-    num_new_mutations = np.random.poisson(model['mu'])
-    for _ in range(num_new_mutations):
-        position = random.randint(0, numbits - 1)
-        mutation_effect = get_mutation_effect(model)
-        free_params['mutID'] += 1
-        integer_value = int(mutation_effect * 1000)
-        mutation_hist[integer_value] += 1
-        which_copy = random.randint(0, 1)
-        mutations[ind][which_copy][position].append(integer_value)
-    return mutations, mutation_hist
-    
+    rng = free_params['rng'].mutation
+    num_new_mutations = rng.poisson(model['mu'], num_children)
+    total = int(num_new_mutations.sum())
+    positions = rng.integers(0, numbits, total, dtype=np.int32)
+    copies = rng.integers(0, 2, total)
+    effects = free_params['mutation_effects'].draw(total)
+    free_params['mutID'] += total
+    mutation_hist += np.bincount(np.clip(effects, -1000, 1000) + 1000, minlength=2001)
+    first = np.concatenate(([0], np.cumsum(num_new_mutations)))
+
+    return (first, positions, copies, effects), mutation_hist
+
+# * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * 
+
+def add_new_mutations(ind, mutations, positions, copies, effects):
+
+    for copy in range(2):
+        new = copies == copy
+        if new.any():
+            all_positions = np.concatenate((mutations[ind][copy][0], positions[new]))
+            all_effects = np.concatenate((mutations[ind][copy][1], effects[new]))
+            order = np.argsort(all_positions, kind='stable')
+            mutations[ind][copy] = (all_positions[order], all_effects[order])
+    return mutations, len(effects), int(effects.sum())
+
+# * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * 
+
+class MutationEffectSampler:
+
+    # Fitness effects (x 1000) of new mutations. Neutral with probability f_neutral, otherwise Weibull(shape, scale) / Weibull_adj,
+    # and deleterious unless it falls within f_beneficial. All draws come from the mutation stream, through pre-drawn blocks.
+    def __init__(self, model, rng):
+        self.shape = model['shape']
+        self.scale = model['scale']
+        self.Weibull_adj = model['Weibull_adj']
+        self.f_neutral = model['f_neutral']
+        self.f_beneficial = model['f_beneficial']
+        self.rng = rng
+        self.weibull = DrawBuffer(lambda size: self.scale * rng.mutation.weibull(self.shape, size), rng.mutation.bit_generator)
+
+    def draw(self, n):
+        mutation_effect = np.zeros(n)
+        non_neutral = self.rng.uniform('mutation', n) >= self.f_neutral
+        mutation_effect[non_neutral] = self.weibull.take(np.count_nonzero(non_neutral)) / self.Weibull_adj
+        deleterious = self.rng.uniform('mutation', n) > self.f_beneficial
+        mutation_effect[non_neutral & deleterious] *= -1
+        return (mutation_effect * 1000).astype(np.int32)
+
 # * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * 
 
 def count_fitness_and_mutations(mutations, ind):
 
-    mutation_count = 0
-    fitness = 1
-    for position in range(len(mutations[ind][0])):
-        mutation_count += len(mutations[ind][0][position])
-        if mutation_count > 0:
-            fitness += sum(mutations[ind][0][position]) / (1000 * mutation_count)
-    for position in range(len(mutations[ind][1])):
-        mutation_count += len(mutations[ind][1][position])
-        if mutation_count > 0:
-            fitness += sum(mutations[ind][0][position]) / (1000 * mutation_count)
+    # Full recount; births add up fitness as the child is assembled, and this must agree with them
+    mutation_count = len(mutations[ind][0][1]) + len(mutations[ind][1][1])
+    fitness = 1 + (int(mutations[ind][0][1].sum()) + int(mutations[ind][1][1].sum())) / 1000
 
     return mutation_count, fitness
 
@@ -508,198 +809,207 @@ def count_fitness_and_mutations(mutations, ind):
 
 def birth(IndData, model, free_params, birthlist, year, chromosomes, chromosome_arm_data, mutations, mutation_hist, numbits):
 
-    for birth_info in birthlist:
-        dad = birth_info['dad']
-        mom = birth_info['mom']
+    if model['track_mutations']:
+        (first, positions, copies, effects), mutation_hist = generate_new_mutations(len(birthlist['mom']), model, free_params, mutation_hist)
+    if model['track_DNA'] or model['track_mutations']:
+        dad_masks, dad_cents, dad_breakpoints = free_params['crossovers'].draw(len(birthlist['dad']), 0, free_params['rng'], model['track_DNA'])
+        mom_masks, mom_cents, mom_breakpoints = free_params['crossovers'].draw(len(birthlist['mom']), 1, free_params['rng'], model['track_DNA'])
+    sexes = free_params['rng'].meiosis.integers(0, 2, len(birthlist['mom'])).tolist()
+    children = []
+    first_child = free_params['indID'] + 1
+
+    for i, (dad, mom) in enumerate(zip(birthlist['dad'].tolist(), birthlist['mom'].tolist())):
         free_params['indID'] += 1
         child = free_params['indID']
-        create_child(year, IndData, dad, mom, child, model)
-
-        if model['track_DNA'] or model['track_mutations']:
-            mask1, cents1 = createmask(0, free_params, chromosome_arm_data)
-            mask2, cents2 = createmask(1, free_params, chromosome_arm_data)
+        create_child(year, IndData, dad, mom, child, sexes[i], model)
+        c, d, m = IndData.row_of[child], IndData.row_of[dad], IndData.row_of[mom]
 
         if model['track_DNA']:
-            chromosomes[child] = {}
-            chromosomes[child][0] = bitarray(numbits)
-            chromosomes[child][1] = bitarray(numbits)
-            chromosomes[child][0].setall(0)
-            chromosomes[child][1].setall(0)
-            if IndData[dad]['allele_count'] > 0:
-                meiosis(dad, child, chromosomes, mask1, 0)
-            if IndData[mom]['allele_count'] > 0:
-                meiosis(mom, child, chromosomes, mask2, 1)
-            IndData[child]['allele_count'] = count_alleles(child, chromosomes)
-            if IndData[child]['allele_count'] < 1:
-                del chromosomes[child]
-            else:
-                IndData[child]['num_blocks'] = count_blocks(chromosomes, child)
-            
-            inherit_centromeres (cents1, cents2, IndData, dad, mom, child, chromosome_arm_data)
-
-            IndData[child]['Y_gens'] = -1
-            if IndData[dad]['Y_gens'] > -1 and IndData[child]['sex'] == 0:
-                IndData[child]['Y_gens'] = IndData[dad]['Y_gens'] + 1
-            IndData[child]['mt_gens'] = -1
-            if IndData[mom]['mt_gens'] > -1:
-                IndData[child]['mt_gens'] = IndData[mom]['mt_gens'] + 1
+            children.append(child)
+            inherit_centromeres (dad_cents[i], mom_cents[i], IndData, dad, mom, child, chromosome_arm_data)
+
+            if IndData.Y_gens[d] > -1 and IndData.sex[c] == 0:
+                IndData.Y_gens[c] = IndData.Y_gens[d] + 1
+            if IndData.mt_gens[m] > -1:
+                IndData.mt_gens[c] = IndData.mt_gens[m] + 1
             
-            IndData[child]['min_genealo_gens'] = -1
-            min_genealo = IndData[dad]['min_genealo_gens']
-            if IndData[mom]['min_genealo_gens'] > min_genealo:
-                min_genealo = IndData[mom]['min_genealo_gens']
+            min_genealo = max(IndData.min_genealo_gens[d], IndData.min_genealo_gens[m])
             if min_genealo > -1:
-                IndData[child]['min_genealo_gens'] = min_genealo + 1
+                IndData.min_genealo_gens[c] = min_genealo + 1
 
-            IndData[child]['max_genealo_gens'] = -1
-            max_genealo = IndData[dad]['max_genealo_gens']
-            if IndData[mom]['max_genealo_gens'] > max_genealo:
-                max_genealo = IndData[mom]['max_genealo_gens']
+            max_genealo = max(IndData.max_genealo_gens[d], IndData.max_genealo_gens[m])
             if max_genealo > -1:
-                IndData[child]['max_genealo_gens'] = max_genealo + 1
+                IndData.max_genealo_gens[c] = max_genealo + 1
 
         if model['track_mutations']:
-            mutations[child] = [[[[], []] for _ in range(numbits)] for _ in range(2)]
-            mutations = inherit_mutations(mask1, mask2, dad, mom, child, mutations, numbits)
-            mutations, mutation_hist = generate_new_mutations(child, model, free_params, mutations, mutation_hist)
-            IndData[child]['mutations'], IndData[child]['fitness'] = count_fitness_and_mutations(mutations, child)
+            mutations, mutation_count, total_effect = inherit_mutations(dad_breakpoints[i], mom_breakpoints[i], dad, mom, child, mutations)
+            new = slice(first[i], first[i + 1])
+            mutations, new_count, new_effect = add_new_mutations(child, mutations, positions[new], copies[new], effects[new])
+            IndData.mutations[c] = mutation_count + new_count
+            IndData.fitness[c] = 1 + (total_effect + new_effect) / 1000
+
+    # Meiosis for the whole cohort; only children who inherited some seed DNA keep a genome
+    if children:
+        copy_0 = meiosis(birthlist['dad'], dad_masks, chromosomes)
+        copy_1 = meiosis(birthlist['mom'], mom_masks, chromosomes)
+        allele_count = count_alleles(copy_0, copy_1)
+        IndData.allele_count[IndData.row_of[children]] = allele_count
+        carriers = allele_count > 0
+        carrier_ids = np.array(children)[carriers].tolist()
+        chromosomes.add(carrier_ids, copy_0[carriers], copy_1[carriers])
+        IndData.num_blocks[IndData.row_of[carrier_ids]] = chromosomes.num_blocks(carrier_ids)
+    IndData.stats.count(IndData, IndData.row_of[first_child:free_params['indID'] + 1])
+    IndData.cohorts.add(IndData, IndData.row_of[first_child:free_params['indID'] + 1])
     return mutation_hist
 
 # * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * *
 
-def count_blocks(chromosomes, ind):
-
-    num_blocks = 0
-    for copy in range(2):
-        bit_array = chromosomes[ind][copy]
-        bit_string = bit_array.to01()
-        if bit_string == '0' * len(bit_string):  # if the bit array contains only unset bits
-            continue
-        substrings = bit_string.split("0")
-        substrings = [substring for substring in substrings if substring]
-        num_blocks += len(substrings)
-
-    return num_blocks
-
-# * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * *
-
-def setup_marriages(manlist, womanlist, IndData, model):
+def setup_marriages(manlist, womanlist, IndData, model, free_params):
 
     newmarriages = 0
     if model['random_mating'] == 1:
-        newmarriages = random_mariages(manlist, womanlist, IndData, model)
+        newmarriages = random_mariages(manlist, womanlist, IndData, model, free_params['rng'].mating)
     else:
-        newmarriages = non_random_mariages(manlist, womanlist, IndData, model)
+        newmarriages = non_random_mariages(manlist, womanlist, IndData, model, free_params['rng'].mating)
     return newmarriages
 
 # * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * *
 
-def random_mariages(manlist, womanlist, IndData, model):
+def random_mariages(manlist, womanlist, IndData, model, rng):
 
-    random.shuffle(manlist)
-    random.shuffle(womanlist)
+    rng.shuffle(manlist)
+    rng.shuffle(womanlist)
     men = len(manlist)
     women = len(womanlist)
     max_count = min(men, women)
 
-    for i in range(max_count):
-        man = manlist[i]
-        woman = womanlist[i]
-        IndData[man]['marriage_state'] = woman
-        IndData[woman]['marriage_state'] = man
-        IndData[woman]['year_of_last_birth'] = -model['spacing']
+    husbands = IndData.row_of[manlist[:max_count]]
+    wives = IndData.row_of[womanlist[:max_count]]
+    IndData.marriage_state[husbands] = womanlist[:max_count]
+    IndData.marriage_state[wives] = manlist[:max_count]
+    IndData.cohorts.marry(IndData, husbands)
+    IndData.cohorts.marry(IndData, wives)
+    IndData.year_of_last_birth[wives] = -model['spacing']
 
     return max_count
 
 # * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * 
 
-def non_random_mariages(manlist, womanlist, IndData, model):
+def non_random_mariages(manlist, womanlist, IndData, model, rng):
 
     # This will pick the man-woman pair closest in age (preferring woman younger than men unless none are avaialable),
     # but marriages will not happen if they are > randommating apart in x,y space
 
-    random.shuffle(manlist)
-    random.shuffle(womanlist)
-    men = len(manlist)
-    women = len(womanlist)
-    max_count = min(men, women)
+    rng.shuffle(manlist)
+    rng.shuffle(womanlist)
+    women = IndData.row_of[womanlist]
+    brides = BrideIndex(IndData.lat[women], IndData.lon[women], IndData.birth_year[women], model['random_mating'])
+    newmarriages = 0
+    max_count = min(len(manlist), len(womanlist))
+
+    for man in manlist[:max_count].tolist():
+        if brides.num_available == 0:
+            break
+        h = IndData.row_of[man]
+        choice = brides.find_bride(IndData.lat[h], IndData.lon[h], IndData.birth_year[h])
+
+        if choice is not None:
+            w = women[choice]
+            IndData.marriage_state[h] = IndData.ID[w]
+            IndData.marriage_state[w] = man
+            IndData.cohorts.marry(IndData, [h, w])
+            IndData.year_of_last_birth[w] = 0
+            brides.remove(choice)
+            newmarriages += 1
 
-    for i in range(max_count):
-        man = manlist[i]
-        x1, y1 = IndData[man]['lat'], IndData[man]['lon']
-
-        eligible_females = {}
-        for woman in womanlist:
-            x2, y2 = IndData[woman]['lat'], IndData[woman]['lon']
-            distance = math.sqrt((x2 - x1)**2 + (y2 - y1)**2)
-            if distance <= model['random_mating']:
-               eligible_females[woman] = IndData[woman]['birth_year'] - IndData[man]['birth_year']
-
-        if eligible_females:
-            positive_age_diff = {k: v for k, v in eligible_females.items() if v > 0}
-            negative_age_diff = {k: v for k, v in eligible_females.items() if v <= 0}
-            if positive_age_diff:
-                woman = min(positive_age_diff.items(), key=lambda x: x[1])
-                IndData[man]['marriage_state'] = woman
-                IndData[woman]['marriage_state'] = man
-                IndData[woman]['year_of_last_birth'] = 0
-                womanlist.remove(woman)
-            else:
-                woman  = min(negative_age_diff.items(), key=lambda x: x[1])
-                IndData[man]['marriage_state'] = woman
-                IndData[woman]['marriage_state'] = man
-                IndData[woman]['year_of_last_birth'] = 0
-                womanlist.remove(woman)
+    return newmarriages
 
-    return max_count
+# * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * 
+
+class BrideIndex:
+
+    # Uniform grid over (lat, lon) with cells at least random_mating wide, so every woman a man can reach
+    # lies in his own cell or one of its 8 neighbours. Each cell keeps its women sorted by birth year
+    # (ties in shuffled order), so the closest in age is found by bisection instead of a full scan.
+    def __init__(self, lat, lon, birth_year, reach):
+        self.reach = reach
+        self.width = max(reach, 0.01)    # coordinates are rounded to 0.01
+        self.lat = lat.tolist()
+        self.lon = lon.tolist()
+        self.available = [True] * len(self.lat)
+        self.num_available = len(self.lat)
+        self.cells = {}
+
+        cell_x = np.floor(lat / self.width).astype(np.int64)
+        cell_y = np.floor(lon / self.width).astype(np.int64)
+        order = np.lexsort((np.arange(len(lat)), birth_year, cell_y, cell_x))
+        for woman in order.tolist():
+            cell = self.cells.setdefault((int(cell_x[woman]), int(cell_y[woman])), ([], []))
+            cell[0].append(int(birth_year[woman]))
+            cell[1].append(woman)
+
+    def find_bride(self, x1, y1, birth_year):
+        lat, lon, available, reach = self.lat, self.lon, self.available, self.reach
+        younger, older = None, None    # (birth year, shuffled position) of the best match so far
+        cell_x = math.floor(x1 / self.width)
+        cell_y = math.floor(y1 / self.width)
+        for dx in (-1, 0, 1):
+            for dy in (-1, 0, 1):
+                cell = self.cells.get((cell_x + dx, cell_y + dy))
+                if cell is None:
+                    continue
+                years, women = cell
+                split = bisect.bisect_right(years, birth_year)
+
+                # The younger woman closest in age: the first one in reach born after him
+                for i in range(split, len(years)):
+                    if younger is not None and years[i] > younger[0]:
+                        break
+                    w = women[i]
+                    if available[w] and math.sqrt((lat[w] - x1)**2 + (lon[w] - y1)**2) <= reach:
+                        if younger is None or (years[i], w) < younger:
+                            younger = (years[i], w)
+                        break
+
+                # Otherwise the older woman closest in age, earliest in shuffled order among equals
+                if younger is not None:
+                    continue
+                for i in range(split - 1, -1, -1):
+                    if older is not None and years[i] < older[0]:
+                        break
+                    w = women[i]
+                    if available[w] and math.sqrt((lat[w] - x1)**2 + (lon[w] - y1)**2) <= reach:
+                        if older is None or years[i] > older[0] or w < older[1]:
+                            older = (years[i], w)
+
+        if younger is not None:
+            return younger[1]
+        if older is not None:
+            return older[1]
+        return None
+
+    def remove(self, woman):
+        self.available[woman] = False
+        self.num_available -= 1
 
 # * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * 
 
-def BumpPeopleOff(IndData, chromosomes, mutations, model, free_params, death_risk, year, run):
+def BumpPeopleOff(IndData, chromosomes, mutations, model, free_params, death_risk, year, run, events=None):
 
     random_deaths, culled_deaths, deaths = 0, 0, 0
-    dead_people = []
-    dead_people_data = ""
+    dead_people_data = []
 
     # Random actuarial deaths
-    for ind in IndData:
-        age = year - IndData[ind]["birth_year"]
-        if ind == free_params["seed"]:
-            if age >= IndData[ind]["lifespan"]:
-                dead_person_string = dead_string(ind, IndData, year)
-                dead_people_data += dead_person_string
-                dead_people.append(ind)
-            else:
-                continue
-        fitness = 1
-        if model["track_mutations"] == 1 and model["selection"] == "annual":
-            fitness = 1 + IndData[ind]["fitness"] / 1000
-        die = random.random()
-        risk_modification = model["min_lifespan"] / IndData[ind]["lifespan"]
-        if 0 < age < 5 and ind != free_params["seed"]:
-            if die < 0.0203 * risk_modification + 1 - fitness:
-                IndData[ind]['age_at_death'] = age
-                IndData[ind]['cause_of_death'] = 'r'
-                deaths += 1
-                random_deaths += 1
-                if model["track_dead"]:
-                    dead_person_string = dead_string(ind, IndData, year)
-                    dead_people_data += dead_person_string
-                dead_people.append(ind)
-        else:
-            # The actuarial table is in increments of 5, so:
-            age_group = int( (age / IndData[ind]["lifespan"]) * model["min_lifespan"] / 5) * 5
-            if age_group > 85: # The actuarial table stops at 85, realy old people all have the same probability of dying
-                age_group = 85
-            if die < death_risk[age_group] * risk_modification + 1 - fitness and ind != free_params["seed"]:
-                IndData[ind]['age_at_death'] = age
-                IndData[ind]['cause_of_death'] = 'r'
-                deaths += 1
-                random_deaths += 1
-                if model["track_dead"] == 1:
-                    dead_person_string = dead_string(ind, IndData, year)
-                    dead_people_data += dead_person_string
-                dead_people.append(ind)
+    if events:
+        victims, seed_death = events.deaths(IndData, year, free_params)
+    else:
+        victims, seed_death = annual_mortality(IndData, model, free_params, death_risk, year)
+    deaths += len(victims)
+    random_deaths += len(victims)
+    if model["track_dead"] == 1:
+        dead_people_data.append(dead_records(seed_death, IndData, year))
+        dead_people_data.append(dead_records(victims, IndData, year, 'r'))
+    dead_people = np.concatenate((seed_death, victims))
 
     RIP(dead_people, IndData, model, chromosomes, mutations)
 
@@ -708,109 +1018,769 @@ def BumpPeopleOff(IndData, chromosomes, mutations, model, free_params, death_ris
         max_pop_size = model['bottleneck_size']
 
     # trim excess population
-    if model['max_breeding_inds'] == 0:
-        while len(IndData) > max_pop_size:
-            ind = random.choice(list(IndData.keys()))
-            if ind == free_params["seed"]:
-                continue
-            else:
-                age = year - IndData[ind]["birth_year"]
-                IndData[ind]['age_at_death'] = age
-                IndData[ind]['cause_of_death'] = 'c'
-                deaths += 1
-                culled_deaths += 1
-                if model["track_dead"] == 1:
-                    dead_people_data += dead_string(ind, IndData, year)
-                dead_people = []
-                dead_people.append(ind)
-                RIP(dead_people, IndData, model, chromosomes, mutations)
+    if model['max_breeding_inds'] == 0 and len(IndData) > max_pop_size:
+        victims = choose_cull_victims(IndData, free_params, len(IndData) - max_pop_size)
+        dead_people_data.append(cull(victims, IndData, model, chromosomes, mutations, year))
+        deaths += len(victims)
+        culled_deaths += len(victims)
 
     # Tamp down population growth rate
     expected_numinds = free_params["lastpopsize"] * model["max_growth_rate"]
-    while len(IndData) > expected_numinds:
-        ind = random.choice(list(IndData.keys()))
-        if ind == free_params["seed"]:
-            continue
-        else:
-            age = year - IndData[ind]["birth_year"]
-            IndData[ind]['age_at_death'] = age
-            IndData[ind]['cause_of_death'] = 'c'
-            deaths += 1
-            culled_deaths += 1
-            if model["track_dead"] == 1:
-                dead_people_data += dead_string(ind, IndData, year)
-            dead_people = []
-            dead_people.append(ind)
-            RIP(dead_people, IndData, model, chromosomes, mutations)
+    if len(IndData) > expected_numinds:
+        victims = choose_cull_victims(IndData, free_params, len(IndData) - math.floor(expected_numinds))
+        dead_people_data.append(cull(victims, IndData, model, chromosomes, mutations, year))
+        deaths += len(victims)
+        culled_deaths += len(victims)
 
     # Reduce to specified number of breeding individuals
     if model['max_breeding_inds']:
         breeders = count_breeding_individuals(IndData, year, model)
-        while breeders > max_pop_size:
-            ind = random.choice(list(IndData.keys()))
-            if ind in free_params["seed"]:
-                continue
-            else:
-                age = year - IndData[ind]["birth_year"]
-                IndData[ind]['age_at_death'] = age
-                IndData[ind]['cause_of_death'] = 'c'
-                deaths += 1
-                culled_deaths += 1
-                if model["track_dead"] == 1:
-                    dead_people_data += dead_string(ind, IndData, year)
-                dead_people = []
-                dead_people.append(ind)
-                RIP(dead_people, IndData, model, chromosomes, mutations)
-                breeders = count_breeding_individuals(IndData, year, model)
+        if breeders > max_pop_size:
+            victims = choose_breeder_cull_victims(IndData, free_params, year, model, breeders - max_pop_size)
+            dead_people_data.append(cull(victims, IndData, model, chromosomes, mutations, year))
+            deaths += len(victims)
+            culled_deaths += len(victims)
 
     if model["track_dead"] == 1:
-        model = model["model_id"]
-        filename = os.path.join(results_directory, f"{model}-{run} deaths.csv")
-        with open(filename, mode='a', newline='') as tracked_dead_file:
-            tracked_dead_file.write(dead_people_data)
+        write_death_records(free_params['output'], model, run, np.concatenate(dead_people_data))
     return random_deaths, culled_deaths
 
 # * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * 
 
-def dead_string(ind, IndData, year):
-
-    if ind in IndData:
-        ind_info = IndData[ind]
-        ind_info['dad'] = ind_info.get('dad', -1)
-        ind_info['mom'] = ind_info.get('mom', -1)
-        ind_info['numbirths'] = ind_info.get('numbirths', -1)
-        ind_info['Ygens'] = ind_info.get('Y_gens', -1)
-        ind_info['MTGens'] = ind_info.get('mt_gens', -1)
-        ind_info['MaxGenealGens'] = ind_info.get('max_genealo_gens', -1)
-        ind_info['MinGenealGens'] = ind_info.get('min_genealo_gens', -1)
-        ind_info['seed_alleles'] = ind_info.get('allele_count', -1)
-        ind_info['blocks'] = ind_info.get('num_blocks', -1)
-        ind_info['CentromereCount'] = ind_info.get('centromeres', -1)
-        ind_info['fitness'] = ind_info.get('fitness', -1)
-        ind_info['NumMuts'] = ind_info.get('mutations', -1)
-        ind_info['CauseOfDeath'] = ind_info.get('cause_of_death', -1)
-        info = f"{ind},{ind_info['birth_year']},{year},{ind_info['sex']},{ind_info['dad']},{ind_info['mom']},{ind_info['lifespan']},"
-        info = info + f"{ind_info['lat']},{ind_info['lon']},{ind_info['marriage_state']},{ind_info['numbirths']},{ind_info['Ygens']},"
-        info = info + f"{ind_info['MTGens']},{ind_info['MinGenealGens']},{ind_info['MaxGenealGens']},"
-        info = info + f"{ind_info['seed_alleles']},{ind_info['CentromereCount']},{ind_info['blocks']},"
-        info = info + f"{ind_info['fitness']},{ind_info['NumMuts']},{ind_info['CauseOfDeath']}"
-        info = info + '\n'
+def annual_mortality(IndData, model, free_params, death_risk, year):
+
+    rows = IndData.living_rows()
+    inds = IndData.ID[rows]
+    age = year - IndData.birth_year[rows]
+    lifespan = IndData.lifespan[rows]
+    if len(rows) == 0:
+        return inds, inds
+    die = free_params['rng'].uniform('mortality', len(rows)) < death_probability(IndData, rows, age, model, free_params, death_risk)
+
+    # The seed only dies of old age
+    is_seed = inds == free_params["seed"]
+    victims = inds[die & ~is_seed]
+    seed_death = inds[is_seed & (age >= lifespan)]
+
+    return victims, seed_death
+
+# * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * 
+
+def death_probability(IndData, rows, age, model, free_params, death_risk):
+
+    # age is one age per row, or a row of ages per row
+    lifespan = IndData.lifespan[rows].reshape((-1,) + (1,) * (np.ndim(age) - 1))
+    fitness = 1
+    if model["track_mutations"] == 1 and model["selection"] == "annual":
+        fitness = 1 + IndData.fitness[rows].reshape(lifespan.shape) / 1000
+
+    return hazard(lifespan, age, model, free_params, death_risk) + 1 - fitness
+
+# * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * 
+
+def hazard(lifespan, age, model, free_params, death_risk):
+
+    if np.size(lifespan) and np.max(lifespan) >= len(free_params["hazard_table"]):
+        free_params["hazard_table"] = load_hazard_table(death_risk, model, np.max(lifespan))
+
+    # The actuarial table is in increments of 5 and stops at 85, realy old people all have the same probability of dying
+    age_group = np.minimum((age / lifespan * model["min_lifespan"] / 5).astype(np.int64), 17)
+    age_group[(age > 0) & (age < 5)] = 18
+
+    return free_params["hazard_table"][lifespan, age_group]
+
+# * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * 
+
+def draw_death_years(IndData, rows, model, free_params, death_risk, year):
+
+    # The year each person dies, distributed exactly as if the yearly mortality test were played out from this year on
+    rows = np.asarray(rows, dtype=np.int64)
+    start_age = (year - IndData.birth_year[rows]).astype(np.int64)
+    if model["track_mutations"] == 1 and model["selection"] == "annual":
+        death_age = draw_death_ages_by_group(IndData, rows, start_age, model, free_params, death_risk)
+    else:
+        death_age = np.empty(len(rows), dtype=np.int64)
+        lifespans = IndData.lifespan[rows]
+        for lifespan in np.unique(lifespans).tolist():
+            same = np.flatnonzero(lifespans == lifespan)
+            death_age[same] = draw_death_ages(lifespan, start_age[same], model, free_params, death_risk)
+
+    return year + death_age - start_age
+
+# * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * 
+
+def draw_death_ages(lifespan, start_age, model, free_params, death_risk):
+
+    # Inverts the cumulative hazard for one lifespan with an exponential draw per person. The table runs to the first
+    # age of the oldest age group; past it the risk is constant and the rest of the wait is geometric.
+    tables = free_params["cumulative_hazards"]
+    if lifespan not in tables:
+        oldest = max(math.ceil(85 * lifespan / model["min_lifespan"]) + 1, 5)
+        risk = np.clip(hazard(np.full(oldest + 1, lifespan), np.arange(oldest + 1), model, free_params, death_risk), 0, 1)
+        with np.errstate(divide='ignore'):
+            tables[lifespan] = np.concatenate(([0], np.cumsum(-np.log1p(-risk))))    # hazard accumulated before each age
+    cumulative = tables[lifespan]
+    oldest = len(cumulative) - 2
+
+    target = cumulative[np.minimum(start_age, oldest)] + free_params['rng'].mortality.exponential(size=len(start_age))
+    death_age = np.searchsorted(cumulative, target, side='right') - 1
+    old = (death_age >= oldest) | (start_age >= oldest)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        extra = (target[old] - cumulative[oldest]) // (cumulative[-1] - cumulative[-2])
+    death_age[old] = np.maximum(start_age[old], oldest) + np.minimum(np.nan_to_num(extra, posinf=10 ** 9), 10 ** 9).astype(np.int64)
+
+    return death_age
+
+# * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * 
+
+def draw_death_ages_by_group(IndData, rows, start_age, model, free_params, death_risk):
+
+    # With selection each person's risk is shifted by their own fitness, so there is no shared table. The risk is
+    # still constant across each age group, so the wait within a group is geometric: one draw per age group.
+    death_age = np.full(len(rows), 10 ** 9, dtype=np.int64)    # never, if the risk is zero
+    lifespan = IndData.lifespan[rows]
+    age = start_age.copy()
+    active = np.arange(len(rows))
+
+    def age_group(age, lifespan):
+        return np.minimum((age / lifespan * model["min_lifespan"] / 5).astype(np.int64), 17)
+
+    while len(active):
+        a, life = age[active], lifespan[active]
+        risk = np.clip(death_probability(IndData, rows[active], a, model, free_params, death_risk), 0, 1)
+
+        # First age with a different risk: 1, then 5, then the start of the next age group (never, past the last)
+        group = age_group(a, life)
+        next_age = np.ceil((group + 1) * 5 * life / model["min_lifespan"]).astype(np.int64)
+        next_age = np.where(age_group(next_age - 1, life) > group, next_age - 1, next_age)
+        next_age = np.where(age_group(next_age, life) > group, next_age, next_age + 1)
+        next_age = np.where(a < 5, np.where(a == 0, 1, 5), next_age)
+        last_group = (a >= 5) & (group >= 17)
+
+        wait = np.full(len(active), 10 ** 9, dtype=np.int64)
+        mortal = risk > 0
+        wait[mortal] = free_params['rng'].mortality.geometric(risk[mortal]) - 1
+        dies = mortal & ((wait < next_age - a) | last_group)
+        death_age[active[dies]] = a[dies] + wait[dies]
+        moving_on = ~dies & ~last_group
+        age[active[moving_on]] = next_age[moving_on]
+        active = active[moving_on]
+
+    return death_age
+
+# * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * 
+
+class EventQueue:
+
+    # Event-driven alternative to testing everyone for death and scanning every wife for a birth each year. Death
+    # years are drawn when people enter the population, and a wife is queued for the first year she can conceive
+    # again, so each year only handles the events that fall due. Marriage eligibility comes from the cohort index.
+    DEATH, FERTILE = 0, 1
+
+    def __init__(self, IndData, model, free_params, death_risk, year=0, saved=None):
+        self.model, self.free_params, self.death_risk = model, free_params, death_risk
+        self.heap = []        # (year, kind) of every batch of events still to come
+        self.due = {}         # (year, kind) -> arrays of IDs
+        self.ready = set()    # wives who can conceive this year, checked again when drawn
+        self.dying = []
+        if saved is not None:
+            self.restore(saved)
+            return
+        rows = IndData.living_rows()
+        self.schedule_deaths(IndData, rows, year)
+        wives = rows[(IndData.sex[rows] == 1) & (IndData.marriage_state[rows] > -1)]
+        self.ready.update(IndData.ID[wives].tolist())
+        if free_params["seed"] in IndData:
+            self.seeded(IndData, free_params, year)
+
+    def saved(self):
+        # The queue as arrays, for a checkpoint taken between years (when nothing is left in dying)
+        groups = [np.concatenate(self.due[key]) for key in self.heap]
+        return {'event_keys': np.array(self.heap, dtype=np.int64).reshape(-1, 2),
+                'event_sizes': np.array([len(group) for group in groups], dtype=np.int64),
+                'event_ids': np.concatenate(groups + [np.zeros(0, dtype=np.int64)]),
+                'event_ready': np.array(sorted(self.ready), dtype=np.int64)}
+
+    def restore(self, saved):
+        self.heap = [tuple(key) for key in saved['event_keys'].tolist()]
+        groups = np.split(saved['event_ids'], np.cumsum(saved['event_sizes'])[:-1]) if len(self.heap) else []
+        self.due = {key: [group] for key, group in zip(self.heap, groups)}
+        self.ready = set(saved['event_ready'].tolist())
+
+    def push(self, years, kind, inds):
+        # One entry per year and kind, holding everyone due that year
+        years, inds = np.asarray(years, dtype=np.int64), np.asarray(inds, dtype=np.int64)
+        order = np.argsort(years, kind='stable')
+        due, starts = np.unique(years[order], return_index=True)
+        for when, group in zip(due.tolist(), np.split(inds[order], starts[1:])):
+            if (when, kind) not in self.due:
+                self.due[(when, kind)] = []
+                heapq.heappush(self.heap, (when, kind))
+            self.due[(when, kind)].append(group)
+
+    def pop_due(self, year):
+        while self.heap and self.heap[0][0] <= year:
+            when, kind = heapq.heappop(self.heap)
+            group = np.concatenate(self.due.pop((when, kind)))
+            if kind == self.DEATH:
+                self.dying.append((when, group))
+            else:
+                self.ready.update(group.tolist())
+
+    def schedule_deaths(self, IndData, rows, year):
+        death_years = draw_death_years(IndData, rows, self.model, self.free_params, self.death_risk, year)
+        IndData.death_year[rows] = death_years
+        self.push(death_years, self.DEATH, IndData.ID[rows])
+
+    def seeded(self, IndData, free_params, year):
+        # The seed only dies of old age
+        row = IndData.row_of[free_params["seed"]]
+        IndData.death_year[row] = max(year, IndData.birth_year[row] + IndData.lifespan[row])
+        self.push([IndData.death_year[row]], self.DEATH, [free_params["seed"]])
+
+    def conceptions(self, IndData, year, model):
+        self.pop_due(year)
+        moms = np.sort(np.fromiter(self.ready, dtype=np.int64, count=len(self.ready)))
+        rows = IndData.row_of[moms]
+        alive = rows > -1
+        age = year - IndData.birth_year[rows]
+        eligible = alive & (IndData.marriage_state[rows] > -1) & (age < IndData.lifespan[rows] * model["menopause"])
+        self.ready.difference_update(moms[~eligible].tolist())    # widows are queued again if they remarry
+
+        wives = rows[eligible]
+        wives = wives[IndData.year_of_last_birth[wives] + model["spacing"] <= year]
+        wives = wives[self.free_params['rng'].mating.integers(0, model["birth_prob"], len(wives)) == 0]
+        moms = IndData.ID[wives]
+        dads = IndData.marriage_state[wives]
+        fitness = np.ones(len(wives))
+        if model["track_mutations"] == 1 and model["selection"] == "birth":
+            fitness = (IndData.fitness[IndData.row_of[dads]] + IndData.fitness[wives]) / 2
+        conceived = self.free_params['rng'].uniform('mating', len(wives)) < fitness
+        pregnant_couples = {'dad': dads[conceived], 'mom': moms[conceived]}
+
+        return pregnant_couples, len(pregnant_couples['mom'])
+
+    def born(self, IndData, children, moms, year):
+        self.schedule_deaths(IndData, children, year)
+        self.ready.difference_update(moms.tolist())
+        self.push(np.full(len(moms), year + self.model["spacing"]), self.FERTILE, moms)
+
+    def married(self, IndData, brides, year):
+        rows = IndData.row_of[brides]
+        wives = rows[IndData.marriage_state[rows] > -1]
+        self.push(np.maximum(IndData.year_of_last_birth[wives] + self.model["spacing"], year + 1), self.FERTILE, IndData.ID[wives])
+
+    def deaths(self, IndData, year, free_params):
+        self.pop_due(year)
+        when = np.repeat([when for when, group in self.dying], [len(group) for when, group in self.dying]).astype(np.int64)
+        inds = np.concatenate([group for when, group in self.dying] + [np.zeros(0, dtype=np.int64)])
+        self.dying = []
+        rows = IndData.row_of[inds]
+        current = (rows > -1) & (IndData.death_year[rows] == when)    # culled people leave stale events behind
+        inds = np.unique(inds[current])
+        is_seed = inds == free_params["seed"]
+
+        return inds[~is_seed], inds[is_seed]
+
+# * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * 
+
+def choose_cull_victims(IndData, free_params, num_victims):
+
+    # Anyone but the seed can be culled; all victims are drawn at once, without replacement
+    candidates = IndData.living_ids()
+    candidates = candidates[candidates != free_params["seed"]]
+    num_victims = min(num_victims, len(candidates))
+    victims = free_params['rng'].mortality.choice(candidates, num_victims, replace=False)
+
+    return victims
+
+# * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * 
+
+def choose_breeder_cull_victims(IndData, free_params, year, model, excess_breeders):
+
+    # Cull people in random order, keeping a running count of the breeders among them,
+    # until excess_breeders breeders have been removed
+    rows = IndData.living_rows()
+    rows = free_params['rng'].mortality.permutation(rows[IndData.ID[rows] != free_params["seed"]])
+    breeders_culled = np.cumsum(is_breeding(IndData, rows, year, model))
+    num_victims = min(np.searchsorted(breeders_culled, excess_breeders) + 1, len(rows))
+    victims = IndData.ID[rows[:num_victims]]
+
+    return victims
+
+# * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * 
+
+def cull(victims, IndData, model, chromosomes, mutations, year):
+
+    dead_people_data = None
+    if model["track_dead"] == 1:
+        dead_people_data = dead_records(victims, IndData, year, 'c')
+    RIP(victims, IndData, model, chromosomes, mutations)
+
+    return dead_people_data
+
+# * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * 
+
+# One death log record; the field names are the column headers of deaths.csv
+DEATH_RECORD = np.dtype([('ID', np.int64), ('birthyear', np.int32), ('deathyear', np.int32), ('sex', np.int8), ('father', np.int64),
+                         ('mother', np.int64), ('lifespan', np.int16), ('lat', np.float64), ('lon', np.float64), ('married', np.int64),
+                         ('numbirths', np.int32), ('Ygens', np.int32), ('MTgens', np.int32), ('MinGenealGens', np.int32),
+                         ('MaxGenealGens', np.int32), ('SeedAlleles', np.int32), ('CentromereCount', np.int8), ('blocks', np.int32),
+                         ('fitness', np.float64), ('NumMuts', np.int32), ('CauseOfDeath', 'S2')])
+
+def dead_records(dead_people, IndData, year, cause_of_death=-1):
+
+    rows = IndData.row_of[np.asarray(dead_people, dtype=np.int64)]
+    records = np.zeros(len(rows), dtype=DEATH_RECORD)
+    centromere_count = np.where(IndData.has_centromeres[rows], IndData.centromeres[rows].sum(axis=1), -1)
+    fields = [IndData.ID[rows], IndData.birth_year[rows], year, IndData.sex[rows], IndData.dad[rows], IndData.mom[rows], IndData.lifespan[rows],
+              IndData.lat[rows], IndData.lon[rows], IndData.marriage_state[rows], IndData.numbirths[rows], IndData.Y_gens[rows],
+              IndData.mt_gens[rows], IndData.min_genealo_gens[rows], IndData.max_genealo_gens[rows],
+              IndData.allele_count[rows], centromere_count, IndData.num_blocks[rows],
+              IndData.fitness[rows], IndData.mutations[rows], str(cause_of_death)]
+    for name, field in zip(DEATH_RECORD.names, fields):
+        records[name] = field
+
+    return records
+
+def dead_string(records):
+
+    # CSV lines for a batch of death records, formatted a column at a time
+    columns = [records[name].astype(str).tolist() if records.dtype[name].kind == 'S' else list(map(str, records[name].tolist())) for name in DEATH_RECORD.names]
+    info = ''.join([','.join(values) + '\n' for values in zip(*columns)])
 
     return info
 
 # * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * 
 
+def write_death_records(output, model, run, records):
+
+    # Deaths go to deaths.csv, or with the binary death log, are appended as raw records to deaths.npy
+    filename = os.path.join(results_directory, f"{model['model_id']}-{run} deaths")
+    if model['death_log'] == 'Binary':
+        output.write(filename + '.npy', records.tobytes())
+    else:
+        output.write(filename + '.csv', dead_string(records))
+
+def create_death_log(filename, records=None):
+
+    # A .npy file of DEATH_RECORDs. The header has room for any record count; it is brought up to date by
+    # finish_death_log, but readers work out the count from the file size, so a log cut short is still readable.
+    if records is None:
+        records = np.zeros(0, dtype=DEATH_RECORD)
+    with open(filename, 'wb') as file:
+        file.write(death_log_header(len(records)))
+        file.write(records.tobytes())
+
+def death_log_header(count):
+
+    descr = np.lib.format.dtype_to_descr(DEATH_RECORD)
+    header = "{'descr': %r, 'fortran_order': False, 'shape': (%d,), }" % (descr, count)
+    length = len("{'descr': %r, 'fortran_order': False, 'shape': (%d,), }" % (descr, 10 ** 18)) + 11
+    length += -length % 64
+    return b'\x93NUMPY\x01\x00' + np.uint16(length - 10).tobytes() + header.ljust(length - 11).encode('latin1') + b'\n'
+
+def finish_death_log(filename):
+
+    records = open_death_log(filename)
+    count = len(records)
+    del records
+    with open(filename, 'r+b') as file:
+        file.write(death_log_header(count))
+
+def open_death_log(filename):
+
+    # The records of a binary death log, memory-mapped: columns are read from disk only as they are used,
+    # e.g. open_death_log(filename)['lifespan'].mean()
+    offset = len(death_log_header(0))
+    count = (os.path.getsize(filename) - offset) // DEATH_RECORD.itemsize
+    if count == 0:
+        return np.zeros(0, dtype=DEATH_RECORD)
+    return np.memmap(filename, dtype=DEATH_RECORD, mode='r', offset=offset, shape=(count,))
+
+def death_log_to_csv(filename, csv_filename=None, chunk_size=1000000):
+
+    # Writes a binary death log out as the deaths.csv it stands in for, a chunk at a time
+    records = open_death_log(filename)
+    csv_filename = csv_filename or os.path.splitext(filename)[0] + '.csv'
+    with open(csv_filename, 'w', newline='') as file:
+        csv.writer(file).writerow(DEATH_RECORD.names)
+        for start in range(0, len(records), chunk_size):
+            file.write(dead_string(np.asarray(records[start:start + chunk_size])))
+
+# * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * 
+
 def RIP(dead_people, IndData, model, chromosomes, mutations):
 
+    dead_people = [ind for ind in dead_people if ind in IndData]
+    IndData.remove(dead_people)
     for ind in dead_people:
-        if ind in IndData:
-            if IndData[ind]['marriage_state'] > -1:
-                IndData[ IndData[ind]['marriage_state'] ]['marriage_state'] = -1
-            del IndData[ind]
-            if ind in chromosomes:
-                del chromosomes[ind]
-            if ind in mutations:
-                del mutations[ind]
+        if ind in chromosomes:
+            del chromosomes[ind]
+        if ind in mutations:
+            del mutations[ind]
+
+# * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * 
+
+class PopulationStore:
+
+    # One NumPy column per attribute of a person: name: (dtype, default, per-person shape)
+    columns = {
+        'ID':                 (np.int64,   -1,    ()),
+        'dad':                (np.int64,   -1,    ()),
+        'mom':                (np.int64,   -1,    ()),
+        'sex':                (np.int8,     0,    ()),
+        'birth_year':         (np.int64,    0,    ()),
+        'lifespan':           (np.int64,    0,    ()),
+        'fitness':            (np.float64,  1,    ()),
+        'marriage_state':     (np.int64,   -1,    ()),    # ID of the spouse, -1 if single
+        'year_of_last_birth': (np.int64,    0,    ()),
+        'numbirths':          (np.int64,   -1,    ()),
+        'lat':                (np.float64,  0,    ()),
+        'lon':                (np.float64,  0,    ()),
+        'Y_gens':             (np.int64,   -1,    ()),
+        'mt_gens':            (np.int64,   -1,    ()),
+        'min_genealo_gens':   (np.int64,   -1,    ()),
+        'max_genealo_gens':   (np.int64,   -1,    ()),
+        'allele_count':       (np.int64,   -1,    ()),
+        'num_blocks':         (np.int64,   -1,    ()),
+        'mutations':          (np.int64,   -1,    ()),
+        'death_year':         (np.int64,   -1,    ()),
+        'has_centromeres':    (np.bool_, False,   ()),
+        'centromeres':        (np.bool_, False, (48,)),    # 48, because there is no chromosome 0
+    }
+
+    def __init__(self, capacity=1024):
+        self.capacity = 0
+        self.size = 0
+        self.free_rows = []                                # dead rows, reused before the store grows
+        self.alive = np.zeros(0, dtype=bool)
+        self.row_of = np.full(capacity, -1, dtype=np.int64)    # ID -> row, -1 if dead
+        self.stats = PopulationStats()
+        self.cohorts = CohortIndex()
+        for name, (dtype, default, shape) in self.columns.items():
+            setattr(self, name, np.full((0,) + shape, default, dtype=dtype))
+        self.grow(capacity)
+
+    def __len__(self):
+        return self.size
+
+    def __contains__(self, ind):
+        return 0 <= ind < len(self.row_of) and self.row_of[ind] > -1
+
+    def grow(self, capacity):
+        for name, (dtype, default, shape) in self.columns.items():
+            column = np.full((capacity,) + shape, default, dtype=dtype)
+            column[:self.capacity] = getattr(self, name)
+            setattr(self, name, column)
+        alive = np.zeros(capacity, dtype=bool)
+        alive[:self.capacity] = self.alive
+        self.alive = alive
+        self.free_rows = list(range(capacity - 1, self.capacity - 1, -1)) + self.free_rows
+        self.capacity = capacity
+
+    def add(self, ind, **values):
+        if not self.free_rows:
+            self.grow(self.capacity * 2)
+        if ind >= len(self.row_of):
+            row_of = np.full(max(ind + 1, len(self.row_of) * 2), -1, dtype=np.int64)
+            row_of[:len(self.row_of)] = self.row_of
+            self.row_of = row_of
+        row = self.free_rows.pop()
+        self.ID[row] = ind
+        for name, value in values.items():
+            getattr(self, name)[row] = value
+        self.alive[row] = True
+        self.row_of[ind] = row
+        self.size += 1
+        return row
+
+    def remove(self, dead_people):
+        if len(dead_people) == 0:
+            return
+        rows = self.row_of[np.asarray(dead_people, dtype=np.int64)]
+        self.stats.count(self, rows, -1)
+        self.cohorts.remove(self, rows)
+        spouses = self.marriage_state[rows]
+        spouses = self.row_of[spouses[spouses > -1]]
+        spouses = spouses[spouses > -1]
+        self.marriage_state[spouses] = -1    # widows and widowers can remarry
+        self.cohorts.widow(self, spouses[~np.isin(spouses, rows)])
+        for name, (dtype, default, shape) in self.columns.items():
+            getattr(self, name)[rows] = default
+        self.alive[rows] = False
+        self.row_of[dead_people] = -1
+        self.free_rows.extend(rows.tolist())
+        self.size -= len(rows)
+
+    def living_rows(self):
+        return np.flatnonzero(self.alive)
+
+    def living_ids(self):
+        return self.ID[self.alive]
+
+# * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * 
+
+class CohortIndex:
+
+    # Rows of the living grouped by (birth year, sex), each cohort split into single and married people, so the
+    # yearly marriage, birth and breeder counts only look at the birth years that can qualify
+    def __init__(self):
+        self.cohorts = {}
+        self.max_lifespan = 0
+
+    def add(self, IndData, rows):
+        for row in np.asarray(rows).tolist():
+            key = (int(IndData.birth_year[row]), int(IndData.sex[row]))
+            if key not in self.cohorts:
+                self.cohorts[key] = (set(), set())
+            self.cohorts[key][int(IndData.marriage_state[row] > -1)].add(row)
+        if len(rows):
+            self.max_lifespan = max(self.max_lifespan, int(IndData.lifespan[rows].max()))
+
+    def remove(self, IndData, rows):
+        for row in np.asarray(rows).tolist():
+            key = (int(IndData.birth_year[row]), int(IndData.sex[row]))
+            single, married = self.cohorts[key]
+            single.discard(row)
+            married.discard(row)
+            if not single and not married:
+                del self.cohorts[key]
+
+    def marry(self, IndData, rows, married=True):
+        for row in np.asarray(rows).tolist():
+            cohort = self.cohorts[(int(IndData.birth_year[row]), int(IndData.sex[row]))]
+            cohort[1 - married].discard(row)
+            cohort[married].add(row)
+
+    def widow(self, IndData, rows):
+        self.marry(IndData, rows, married=False)
+
+    def select(self, sex, married, born_after, born_before):
+        # married is 0 (single), 1 (married) or None (both); birth years are exclusive bounds
+        for (birth_year, cohort_sex), cohort in self.cohorts.items():
+            if cohort_sex == sex and (born_after is None or birth_year > born_after) and (born_before is None or birth_year < born_before):
+                if married is None:
+                    yield from cohort
+                else:
+                    yield cohort[married]
+
+    def rows(self, sex, married=None, born_after=None, born_before=None):
+        rows = np.fromiter(chain.from_iterable(self.select(sex, married, born_after, born_before)), dtype=np.int64)
+        return np.sort(rows)
+
+    def count(self, sex, married=None, born_after=None, born_before=None):
+        return sum(len(group) for group in self.select(sex, married, born_after, born_before))
+
+    def check(self, IndData):
+        rows = IndData.living_rows()
+        for sex in range(2):
+            for married in range(2):
+                expected = rows[(IndData.sex[rows] == sex) & ((IndData.marriage_state[rows] > -1) == married)]
+                if not np.array_equal(self.rows(sex, married), expected):
+                    raise RuntimeError(f"Cohort index out of step for sex {sex}, married {married}")
+
+# * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * 
+
+class PopulationStats:
+
+    # Running totals behind the summaries written at each save. Births, seeding and deaths add or subtract the
+    # people they touch, so Save reads them without scanning the population.
+    def __init__(self):
+        self.totals = dict.fromkeys(['Y', 'mt', 'genealo', 'genetic', 'blocks', 'cents', 'mutations', 'fitness'], 0)
+
+    def tally(self, IndData, rows):
+        return {'Y':         int(np.count_nonzero(IndData.Y_gens[rows]           > 0)),
+                'mt':        int(np.count_nonzero(IndData.mt_gens[rows]          > 0)),
+                'genealo':   int(np.count_nonzero(IndData.max_genealo_gens[rows] > 0)),
+                'genetic':   int(np.count_nonzero(IndData.allele_count[rows]     > 0)),
+                'blocks':    int(np.count_nonzero(IndData.num_blocks[rows]       > 0)),
+                'cents':     int(np.count_nonzero(IndData.centromeres[rows])),
+                'mutations': int(IndData.mutations[rows].sum()),
+                'fitness':   float(IndData.fitness[rows].sum())}
+
+    def count(self, IndData, rows, sign=1):
+        for name, value in self.tally(IndData, rows).items():
+            self.totals[name] += sign * value
+
+    def check(self, IndData, mutations=None):
+        # Debug cross-check of the running totals against a full recount (and of each person's mutation count and
+        # fitness against their mutation lists)
+        errors = []
+        for name, value in self.tally(IndData, IndData.living_rows()).items():
+            if not math.isclose(self.totals[name], value, rel_tol=1e-9, abs_tol=1e-6):
+                errors.append(f"{name}: running {self.totals[name]}, recount {value}")
+        if mutations is not None:
+            for ind in IndData.living_ids().tolist():
+                if ind in mutations:
+                    row = IndData.row_of[ind]
+                    mutation_count, fitness = count_fitness_and_mutations(mutations, ind)
+                    if mutation_count != IndData.mutations[row] or not math.isclose(fitness, IndData.fitness[row]):
+                        errors.append(f"ID {ind}: {IndData.mutations[row]} mutations, fitness {IndData.fitness[row]}; recount {mutation_count}, {fitness}")
+        if errors:
+            raise RuntimeError("Population statistics out of step:\n" + "\n".join(errors[:20]))
+
+# * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * 
+
+POPCOUNT = np.array([bin(byte).count('1') for byte in range(256)], dtype=np.uint8)
+
+class GenomeStore:
+
+    # Seed-tracking genomes of everyone carrying seed DNA, packed 8 bins to a byte, most significant bit first (np.packbits).
+    # Each person owns two consecutive rows of one matrix, one per chromosome copy; rows freed by RIP are reused.
+    def __init__(self, numbits, capacity=256):
+        self.numbits = numbits
+        self.nbytes = (numbits + 7) // 8
+        self.capacity = 0
+        self.haplotypes = np.zeros((0, self.nbytes), dtype=np.uint8)
+        self.row_of = {}    # ID -> row of copy 0, copy 1 is the next row
+        self.free_rows = []
+        self.block_hist = np.zeros(numbits + 1, dtype=np.int64)    # number of seed blocks of each length, all haplotypes
+        self.grow(capacity)
+
+    def __len__(self):
+        return len(self.row_of)
+
+    def __contains__(self, ind):
+        return ind in self.row_of
+
+    def __iter__(self):
+        return iter(list(self.row_of))
+
+    def __delitem__(self, ind):
+        row = self.row_of.pop(ind)
+        self.count_block_lengths([row, row + 1], -1)
+        self.haplotypes[row:row + 2] = 0
+        self.free_rows.append(row)
+
+    def grow(self, capacity):
+        haplotypes = np.zeros((2 * capacity, self.nbytes), dtype=np.uint8)
+        haplotypes[:2 * self.capacity] = self.haplotypes
+        self.haplotypes = haplotypes
+        self.free_rows = list(range(2 * capacity - 2, 2 * self.capacity - 2, -2)) + self.free_rows
+        self.capacity = capacity
+
+    def add(self, inds, copy_0, copy_1):
+        while len(self.free_rows) < len(inds):
+            self.grow(2 * self.capacity)
+        rows, replaced = [], []
+        for ind in inds:
+            if ind in self.row_of:
+                replaced += [self.row_of[ind], self.row_of[ind] + 1]
+            else:
+                self.row_of[ind] = self.free_rows.pop()
+            rows.append(self.row_of[ind])
+        rows = np.array(rows, dtype=np.int64)
+        self.count_block_lengths(replaced, -1)
+        self.haplotypes[rows] = copy_0
+        self.haplotypes[rows + 1] = copy_1
+        self.count_block_lengths(np.concatenate([rows, rows + 1]), 1)
+        return rows
+
+    def edges(self, haplotypes):
+        # Each bin XOR the bin before it, working on whole bytes; a zero byte is appended so every block has an end
+        x = np.zeros((len(haplotypes), self.nbytes + 1), dtype=np.uint8)
+        x[:, :-1] = haplotypes
+        previous = x >> 1
+        previous[:, 1:] |= (x[:, :-1] & 1) << 7
+        return x, x ^ previous
+
+    def block_lengths(self, haplotypes):
+        # Length of every block of seed DNA, with the index of the haplotype it lies on
+        _, edges = self.edges(haplotypes)
+        which, positions = np.nonzero(np.unpackbits(edges, axis=1))
+        return which[0::2], positions[1::2] - positions[0::2]
+
+    def count_block_lengths(self, rows, sign):
+        if len(rows):
+            _, lengths = self.block_lengths(self.haplotypes[np.asarray(rows, dtype=np.int64)])
+            self.block_hist += sign * np.bincount(lengths, minlength=len(self.block_hist))
+
+    def num_blocks(self, inds):
+        # Blocks on both copies of each genome, counted as the bins where a block starts
+        rows = self.rows(inds)
+        x, edges = self.edges(self.haplotypes[np.concatenate([rows, rows + 1])])
+        starts = POPCOUNT[x & edges].sum(axis=1, dtype=np.int64)
+        return starts[:len(rows)] + starts[len(rows):]
+
+    def rows(self, inds):
+        return np.array([self.row_of.get(ind, -1) for ind in inds], dtype=np.int64)
+
+    def pack(self, bits):
+        return np.packbits(np.asarray(bits, dtype=bool), axis=-1)
+
+# * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * *
+
+class GenomeArchive:
+
+    # Reads the genome snapshots saved with genome_snapshots, memory-mapped, so a person, a locus or a whole save
+    # year can be looked at after the run without loading the rest, e.g.
+    #   archive = GenomeArchive("results/Model 1-1 genomes")
+    #   archive.genome_store(500)    -> a GenomeStore of year 500, for calculate_block_stats, calculate_genetic_stats, ...
+    def __init__(self, directory):
+        self.directory = directory
+        with open(os.path.join(directory, 'index.csv'), newline='') as file:
+            self.index = {int(row['year']): {key: int(value) for key, value in row.items()} for row in csv.DictReader(file)}
+        self.years = sorted(self.index)
+        self.numbits = next(iter(self.index.values()))['numbits'] if self.index else 0
+        self.nbytes = (self.numbits + 7) // 8
+        self.genomes = self.memmap('genomes.bin', np.uint8, (-1, 2, self.nbytes))
+        self.people = self.memmap('people.bin', SNAPSHOT_PERSON, (-1,))
+
+    def memmap(self, name, dtype, shape):
+        filename = os.path.join(self.directory, name)
+        count = os.path.getsize(filename) // (np.dtype(dtype).itemsize * int(np.prod(shape[1:])))
+        if count == 0:
+            return np.zeros((0,) + shape[1:], dtype=dtype)
+        return np.memmap(filename, dtype=dtype, mode='r', shape=(count,) + shape[1:])
+
+    @staticmethod
+    def sizes(directory):
+        # People and carriers already in an archive, which is where the next snapshot starts
+        with open(os.path.join(directory, 'index.csv'), newline='') as file:
+            rows = list(csv.DictReader(file))
+        if not rows:
+            return {'people': 0, 'carriers': 0}
+        return {'people': int(rows[-1]['people_start']) + int(rows[-1]['people']), 'carriers': int(rows[-1]['carrier_start']) + int(rows[-1]['carriers'])}
+
+    def snapshot(self, year):
+        # (living people of that year, carriers' IDs, carriers' packed haplotypes as (carriers, 2, bytes))
+        entry = self.index[year]
+        people = self.people[entry['people_start']:entry['people_start'] + entry['people']]
+        genomes = self.genomes[entry['carrier_start']:entry['carrier_start'] + entry['carriers']]
+        return people, people['ID'][people['carrier']], genomes
+
+    def genome(self, year, ind):
+        # Both copies of one person's genome as bits, all zero for a living person without seed DNA
+        people, carriers, genomes = self.snapshot(year)
+        if ind not in people['ID']:
+            raise KeyError(f"ID {ind} was not alive in year {year}")
+        which = np.flatnonzero(carriers == ind)
+        packed = genomes[which[0]] if len(which) else np.zeros((2, self.nbytes), dtype=np.uint8)
+        return np.unpackbits(packed, axis=1, count=self.numbits).astype(bool)
+
+    def locus(self, position):
+        # Copies carrying seed DNA at one bin, and living people, for every save year
+        byte, bit = divmod(position, 8)
+        copies = ((self.genomes[:, :, byte] >> (7 - bit)) & 1).sum(axis=1, dtype=np.int64)
+        running = np.concatenate(([0], np.cumsum(copies)))
+        entries = [self.index[year] for year in self.years]
+        counts = np.array([running[entry['carrier_start'] + entry['carriers']] - running[entry['carrier_start']] for entry in entries], dtype=np.int64)
+        return np.array(self.years), counts, np.array([entry['people'] for entry in entries])
+
+    def genome_store(self, year):
+        people, carriers, genomes = self.snapshot(year)
+        store = GenomeStore(self.numbits)
+        store.add(carriers.tolist(), genomes[:, 0], genomes[:, 1])
+        return store
+
+    def save_genome_map(self, year, filename, chromosome_arm_data, max_rows=0, downsample=False):
+        # The same image save_population_genome_map made in that year
+        people, carriers, genomes = self.snapshot(year)
+        haplotypes = np.zeros((len(people), 2, self.nbytes), dtype=np.uint8)
+        haplotypes[people['carrier']] = genomes
+        colours = np.unpackbits(haplotypes.reshape(2 * len(people), self.nbytes), axis=1, count=self.numbits)
+        save_map_image(chromosome_map_header(self.numbits, chromosome_arm_data), colours, filename, max_rows, downsample)
 
 # * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * 
 
@@ -824,39 +1794,33 @@ def initialize_population(IndData, model, free_params, chromosomes, mutations):
         IndData = setup_pop_1(IndData, model, free_params, mutations)
     if model['init_heterozygosity'] > 0:
         setup_init_heterozygosity(IndData, model, free_params, chromosomes)
+    IndData.stats.count(IndData, IndData.living_rows())
+    IndData.cohorts.add(IndData, IndData.living_rows())
 
 # * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * 
 
 def setup_pop_Eden(IndData, model, free_params, mutations):
 
     for indid in range(2):
-        IndData[indid] = {}
+        row = IndData.add(indid)
         if indid % 2 == 0:
-            IndData[indid]['sex'] = 0
-            IndData[indid]['marriage_state'] = indid + 1
+            IndData.sex[row] = 0
+            IndData.marriage_state[row] = indid + 1
         else:
-            IndData[indid]['sex'] = 1
-            IndData[indid]['marriage_state'] = indid - 1
-            IndData[indid]['year_of_last_birth'] = model['spacing'] * -1
-        IndData[indid]['birth_year'] = -100
-        IndData[indid]['lifespan'] = 900
-        IndData[indid]['fitness'] = 1
+            IndData.sex[row] = 1
+            IndData.marriage_state[row] = indid - 1
+            IndData.year_of_last_birth[row] = model['spacing'] * -1
+        IndData.birth_year[row] = -100
+        IndData.lifespan[row] = 900
+        IndData.fitness[row] = 1
         if model['track_DNA']:
-             IndData[indid]['centromeres'] = bitarray(48)
-             IndData[indid]['centromeres'].setall(0)
-             IndData[indid]['Y_gens'] = -1
-             IndData[indid]['mt_gens'] = -1
-             IndData[indid]['min_genealo_gens'] = -1
-             IndData[indid]['max_genealo_gens'] = -1
-             IndData[indid]['allele_count'] = 0
+             IndData.has_centromeres[row] = True
+             IndData.allele_count[row] = 0
         if model['track_mutations']:
-            numbits = free_params['numbits']
-            mutations[indid] = {}
-            mutations[indid][0] = [[] for _ in range(numbits)]
-            mutations[indid][1] = [[] for _ in range(numbits)]
-            IndData[indid]['mutations'] = 0
-            IndData[indid]['fitness'] = 1
-        IndData[indid]['lat'], IndData[indid]['lon'] = 0, 0
+            mutations[indid] = [new_haplotype(), new_haplotype()]
+            IndData.mutations[row] = 0
+            IndData.fitness[row] = 1
+        IndData.lat[row], IndData.lon[row] = 0, 0
 
     return IndData
 
@@ -865,33 +1829,25 @@ def setup_pop_Eden(IndData, model, free_params, mutations):
 def setup_pop_Flood(IndData, model, free_params, mutations):
 
     for indid in range(6):
-        IndData[indid] = {}
+        row = IndData.add(indid)
         if indid % 2 == 0:
-            IndData[indid]['sex'] = 0
-            IndData[indid]['marriage_state'] = indid + 1
+            IndData.sex[row] = 0
+            IndData.marriage_state[row] = indid + 1
         else:
-            IndData[indid]['sex'] = 1
-            IndData[indid]['marriage_state'] = indid - 1
-            IndData[indid]['year_of_last_birth'] = model['spacing'] * -1
-        IndData[indid]['birth_year'] = -100
-        IndData[indid]['lifespan'] = 650
-        IndData[indid]['fitness'] = 1
+            IndData.sex[row] = 1
+            IndData.marriage_state[row] = indid - 1
+            IndData.year_of_last_birth[row] = model['spacing'] * -1
+        IndData.birth_year[row] = -100
+        IndData.lifespan[row] = 650
+        IndData.fitness[row] = 1
         if model['track_DNA']:
-             IndData[indid]['centromeres'] = bitarray(48)
-             IndData[indid]['centromeres'].setall(0)
-             IndData[indid]['Y_gens'] = -1
-             IndData[indid]['mt_gens'] = -1
-             IndData[indid]['min_genealo_gens'] = -1
-             IndData[indid]['max_genealo_gens'] = -1
-             IndData[indid]['allele_count'] = 0
+             IndData.has_centromeres[row] = True
+             IndData.allele_count[row] = 0
         if model['track_mutations']:
-            numbits = free_params['numbits']
-            mutations[indid] = {}
-            mutations[indid][0] = [[] for _ in range(numbits)]
-            mutations[indid][1] = [[] for _ in range(numbits)]
-            IndData[indid]['mutations'] = 0
-            IndData[indid]['fitness'] = 1
-        IndData[indid]['lat'], IndData[indid]['lon'] = 0, 0
+            mutations[indid] = [new_haplotype(), new_haplotype()]
+            IndData.mutations[row] = 0
+            IndData.fitness[row] = 1
+        IndData.lat[row], IndData.lon[row] = 0, 0
 
     return IndData
 
@@ -900,7 +1856,6 @@ def setup_pop_Flood(IndData, model, free_params, mutations):
 def setup_pop_1(IndData, model, free_params, mutations):
 
     indid = 0
-    numbits = free_params['numbits']
     n = model['start_pop_size']
 
     structure = [0] * 100
@@ -913,30 +1868,28 @@ def setup_pop_1(IndData, model, free_params, mutations):
             if age < 100:
                 structure[age] = int(p * n)
 
+    rng = free_params['rng'].population
+    weights = np.array(structure, dtype=np.float64)
+    ages = rng.choice(len(structure), n, p=weights / weights.sum()).tolist()
+    sexes = rng.integers(0, 2, n).tolist()
+    lats, lons = random_coordinates(rng, n)
     for indid in range(n):
-        age = random.choices(range(len(structure)), weights=structure)[0]
-        IndData[indid] = {}
-        IndData[indid]['sex'] = random.randint(0, 1)
-        IndData[indid]['birth_year'] = -age
-        IndData[indid]['lifespan'] = model['init_lifespan']
-        IndData[indid]['marriage_state'] = -1
-        IndData[indid]['year_of_last_birth'] = model['spacing'] * -1
-        IndData[indid]['fitness'] = 1
+        age = ages[indid]
+        row = IndData.add(indid)
+        IndData.sex[row] = sexes[indid]
+        IndData.birth_year[row] = -age
+        IndData.lifespan[row] = model['init_lifespan']
+        IndData.marriage_state[row] = -1
+        IndData.year_of_last_birth[row] = model['spacing'] * -1
+        IndData.fitness[row] = 1
         if model['track_DNA']:
-             IndData[indid]['centromeres'] = bitarray(48)
-             IndData[indid]['centromeres'].setall(0)
-             IndData[indid]['Y_gens'] = -1
-             IndData[indid]['mt_gens'] = -1
-             IndData[indid]['min_genealo_gens'] = -1
-             IndData[indid]['max_genealo_gens'] = -1
-             IndData[indid]['allele_count'] = 0
+             IndData.has_centromeres[row] = True
+             IndData.allele_count[row] = 0
         if model['track_mutations']:
-            mutations[indid] = {}
-            mutations[indid][0] = [[] for _ in range(numbits)]
-            mutations[indid][1] = [[] for _ in range(numbits)]
-            IndData[indid]['mutations'] = 0
-            IndData[indid]['fitness'] = 1
-        IndData[indid]['lat'], IndData[indid]['lon'] = random_coordinates()
+            mutations[indid] = [new_haplotype(), new_haplotype()]
+            IndData.mutations[row] = 0
+            IndData.fitness[row] = 1
+        IndData.lat[row], IndData.lon[row] = lats[indid], lons[indid]
 
     return IndData
 
@@ -946,96 +1899,86 @@ def setup_init_heterozygosity(IndData, model, free_params, chromosomes):
 
     init_het = model['init_heterozygosity']
     numbits = free_params['numbits']
-    for ind in IndData:
-        chromosomes[ind] = {}
-        chromosomes[ind][0] = bitarray(numbits)
-        chromosomes[ind][1] = bitarray(numbits)
-        chromosomes[ind][0].setall(0)
-        chromosomes[ind][1].setall(0)
-        for i in range(numbits):
-            if random.random() < init_het:
-                chromosomes[ind][0][i] = 1
-        IndData[ind]['allele_count'] = count_alleles(ind, chromosomes)
+    inds = IndData.living_ids()
+    copy_0 = chromosomes.pack(free_params['rng'].population.random((len(inds), numbits)) < init_het)
+    copy_1 = np.zeros_like(copy_0)
+    chromosomes.add(inds.tolist(), copy_0, copy_1)
+    IndData.allele_count[IndData.row_of[inds]] = count_alleles(copy_0, copy_1)
 
 # * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * 
 
-def random_coordinates():
+def random_coordinates(rng, n):
 
-    theta = random.uniform(0, 2 * math.pi)
-    r = random.uniform(0, 0.5)
-    x = round(r * math.cos(theta), 2)
-    y = round(r * math.sin(theta), 2)
+    theta = rng.uniform(0, 2 * math.pi, n)
+    r = rng.uniform(0, 0.5, n)
+    x = np.round(r * np.cos(theta), 2).tolist()
+    y = np.round(r * np.sin(theta), 2).tolist()
     return x, y
 
 # * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * 
 
 def Innoculate_random_person(IndData, chromosomes, free_params):
 
-    seed_individual = random.choice(list(IndData.keys()))
+    seed_individual = int(free_params['rng'].population.choice(IndData.living_ids()))
     free_params["seed"] = seed_individual
-    if IndData[seed_individual]["sex"] == 0:
-        IndData[seed_individual]["Y_gens"] = 0
-    IndData[seed_individual]["mt_gens"] = 0
-    IndData[seed_individual]["min_genealo_gens"] = 0
-    IndData[seed_individual]["max_genealo_gens"] = 0
-    chrombits = bitarray(48) # 48, because there is no chromosome 0
-    chrombits.setall(1)
-    IndData[seed_individual]["centromeres"] = chrombits
+    row = IndData.row_of[seed_individual]
+    IndData.stats.count(IndData, [row], -1)
+    if IndData.sex[row] == 0:
+        IndData.Y_gens[row] = 0
+    IndData.mt_gens[row] = 0
+    IndData.min_genealo_gens[row] = 0
+    IndData.max_genealo_gens[row] = 0
+    IndData.centromeres[row] = True    # 48, because there is no chromosome 0
+    IndData.has_centromeres[row] = True
     numbits = free_params["numbits"]
-    IndData[seed_individual]["allele_count"] = numbits * 2
-    chromosomes[seed_individual] = [bitarray(numbits), bitarray(numbits)]
-    chromosomes[seed_individual][0].setall(1)
-    chromosomes[seed_individual][1].setall(1)
+    IndData.allele_count[row] = numbits * 2
+    seed_genome = chromosomes.pack(np.ones((1, numbits)))
+    chromosomes.add([seed_individual], seed_genome, seed_genome)
+    IndData.stats.count(IndData, [row])
 
 # * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * 
 
 def count_breeding_individuals(IndData, year, model):
 
-    count = 0
-    for ind in IndData:
-        age = year - IndData[ind]["birth_year"]
-        sex = IndData[ind]["sex"]
-        if age > model["maturity"]:
-            if sex == 0:
-                count += 1
-            else:
-                if age < IndData[ind]["lifespan"] * model["menopause"]:
-                    count += 1
+    # Every man past maturity counts; women are checked against the menopause age only in cohorts that can qualify
+    youngest = year - model["maturity"]
+    oldest = math.floor(year - IndData.cohorts.max_lifespan * model["menopause"]) - 1
+    women = IndData.cohorts.rows(1, born_after=oldest, born_before=youngest)
+    count = IndData.cohorts.count(0, born_before=youngest) + int(np.count_nonzero(is_breeding(IndData, women, year, model)))
 
     return(count)
 
 # * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * 
 
-def calculate_misc_stats(IndData):
+def is_breeding(IndData, rows, year, model):
+
+    age = year - IndData.birth_year[rows]
+    mature = age > model["maturity"]
+    fertile = (IndData.sex[rows] == 0) | (age < IndData.lifespan[rows] * model["menopause"])
+
+    return mature & fertile
+
+# * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * 
 
-    Y       = sum(1 for ind in IndData.values() if ind.get("Y_gens",           -1) > 0)
-    mt      = sum(1 for ind in IndData.values() if ind.get("mt_gens",          -1) > 0)
-    genealo = sum(1 for ind in IndData.values() if ind.get("max_genealo_gens", -1) > 0)
-    genetic = sum(1 for ind in IndData.values() if ind.get("allele_count",     -1) > 0 )
-    blocks  = sum(1 for ind in IndData.values() if ind.get("num_blocks",       -1) > 0 )
-    cents = sum(ind.get("centromeres", bitarray()).count() for ind in IndData.values())
+def calculate_misc_stats(IndData):
 
-    return Y, mt, genealo, genetic, blocks, cents
+    totals = IndData.stats.totals
+    return totals['Y'], totals['mt'], totals['genealo'], totals['genetic'], totals['blocks'], totals['cents']
 
 # * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * 
 
 def calculate_block_stats(chromosomes):
 
-    all_block_lengths = []
-    for ind in chromosomes:
-        for copy in range(2):
-            bit_array = chromosomes[ind][copy]
-            bit_string = bit_array.to01()
-            substrings = bit_string.split("0")
-            substrings = [substring for substring in substrings if substring]
-            all_block_lengths.extend(map(len, substrings))
-    if not all_block_lengths:
+    # Block lengths are tallied as genomes are added and removed, so this does not depend on the population size
+    block_hist = chromosomes.block_hist
+    lengths = np.arange(len(block_hist))
+    total_blocks = int(block_hist.sum())
+    if not total_blocks:
         return 0, 0, 0
 
-    total_blocks = len(all_block_lengths)
-    average_length = sum(all_block_lengths) / total_blocks
+    average_length = float(block_hist @ lengths) / total_blocks
     average_length = round(average_length, 1)
-    variance = round( sum((length - average_length) ** 2 for length in all_block_lengths) / total_blocks, 2)
+    variance = round(float(block_hist @ (lengths - average_length) ** 2) / total_blocks, 2)
     std_dev = variance ** 0.5
     std_dev = round(std_dev, 1)
 
@@ -1043,53 +1986,50 @@ def calculate_block_stats(chromosomes):
 
 # * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * 
 
-def calculate_genetic_stats(chromosomes, numbits, numinds):
-
-    seed_genome_retained = bitarray(numbits)
-    seed_genome_retained.setall(0)
-    bit_counts = [0] * numbits
-    tot_het = 0
-    hetbits = bitarray(numbits)
-    hetbits.setall(0)
-    for ind in chromosomes:
-        seed_genome_retained, bit_counts, tot_het = seed_counts(chromosomes, ind, numbits, seed_genome_retained, bit_counts, tot_het)
-    
-    numbitsretained = seed_genome_retained.count(1)
+def calculate_genetic_stats(chromosomes, numbits, numinds, chromosome_starts=None):
+
+    rows = chromosomes.rows(list(chromosomes))
+    copy_0, copy_1 = chromosomes.haplotypes[rows], chromosomes.haplotypes[rows + 1]
+    seed_genome_retained = np.bitwise_or.reduce(copy_0 | copy_1, axis=0)
+    bit_counts = seed_counts(copy_0, numbits) + seed_counts(copy_1, numbits)
+    tot_het = int(POPCOUNT[copy_0 ^ copy_1].sum(dtype=np.int64))
+
+    numbitsretained = int(POPCOUNT[seed_genome_retained].sum(dtype=np.int64))
     perc_seed_genome_retained = numbitsretained / numbits * 100
-    non_zero_counts = [count for count in bit_counts if count > 0]
-    av_seed_genome_coverage = sum(non_zero_counts) / (len(non_zero_counts) * numbits) if non_zero_counts else 0
+    non_zero_counts = bit_counts[bit_counts > 0]
+    av_seed_genome_coverage = non_zero_counts.sum() / (len(non_zero_counts) * numbits) if len(non_zero_counts) else 0
     av_heterozygosity = tot_het / (numbits * numinds) * 100
-
-    return perc_seed_genome_retained, av_seed_genome_coverage, av_heterozygosity
+    if chromosome_starts is None:
+        return perc_seed_genome_retained, av_seed_genome_coverage, av_heterozygosity
+
+    # The same three statistics for each chromosome, from the per-bin counts
+    lengths = np.diff(np.append(chromosome_starts, numbits))
+    het_counts = seed_counts(copy_0 ^ copy_1, numbits)
+    retained = np.add.reduceat(bit_counts > 0, chromosome_starts)
+    covered = np.add.reduceat(bit_counts, chromosome_starts)
+    by_chromosome = np.column_stack([retained / lengths * 100,
+                                     np.divide(covered, retained * lengths, out=np.zeros(len(lengths)), where=retained > 0),
+                                     np.add.reduceat(het_counts, chromosome_starts) / (lengths * numinds) * 100])
+    return perc_seed_genome_retained, av_seed_genome_coverage, av_heterozygosity, by_chromosome
 
 # * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * 
 
-def seed_counts(chromosomes, ind, numbits, seed_genome_retained, bit_counts, tot_het):
-
-    bitarray_0 = bitarray(numbits)
-    bitarray_1 = bitarray(numbits)
-    bitarray_0.setall(0)
-    bitarray_1.setall(0)
-    if chromosomes[ind][0]:
-        bitarray_0 = chromosomes[ind][0]
-    if chromosomes[ind][1]:
-        bitarray_1 = chromosomes[ind][1]
-    seed_genome_retained |= bitarray_0 | bitarray_1
-    for index in range(numbits):
-        bit_counts[index] += bitarray_0[index] + bitarray_1[index]
-    hetbits = bitarray_0 ^ bitarray_1
-    num_het = hetbits.count(1)
-    tot_het += num_het
-    return seed_genome_retained, bit_counts, tot_het
+def seed_counts(haplotypes, numbits):
+
+    # Number of haplotypes with each bin set, summed one bit position of the packed bytes at a time
+    bit_counts = np.zeros(8 * haplotypes.shape[1], dtype=np.int64)
+    for bit in range(8):
+        bit_counts[bit::8] = ((haplotypes >> (7 - bit)) & 1).sum(axis=0, dtype=np.int64)
+    return bit_counts[:numbits]
 
 # * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * 
 
 def calculate_fitness_stats(IndData, numbits):
 
     numinds = len(IndData)
-    NumMuts = sum(IndData[ind]['mutations'] for ind in IndData)
+    NumMuts = IndData.stats.totals['mutations']
     AvMutsInd = NumMuts / numinds
-    total_fitness = sum(IndData[ind]['fitness'] for ind in IndData)
+    total_fitness = IndData.stats.totals['fitness']
     AvFitInd = total_fitness / numinds
     AvFitBin =  total_fitness / (numbits * numinds * 2)
     AvMutsInd = NumMuts / numinds
@@ -1110,8 +2050,8 @@ def load_chromosome_data(multiplier):
             chrom = int(row['Chromosome'])
             arm_type = int(row['Arm'])         # 0 = p, 1 = q
             arm_type = 'p' if arm_type == 0 else 'q'
-            arm_start = int(row['Start'] * multiplier)
-            arm_length = int(row['Length'] * multiplier)
+            arm_start = int(row['Start']) * multiplier
+            arm_length = int(row['Length']) * multiplier
             genome_size += arm_length
             if chrom not in chromosome_arm_data:
                 chromosome_arm_data[chrom] = {}
@@ -1126,6 +2066,26 @@ def load_chromosome_data(multiplier):
 
 # * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * 
 
+def load_recombination_map(filename, multiplier, numbits):
+
+    # Relative recombination rate per bin of the unscaled genome; each bin is split evenly when multiplier > 1
+    bins, rates = [], []
+    with open(os.path.join(data_directory, filename), 'r', newline='') as file:
+        reader = csv.DictReader(file)
+        for row in reader:
+            bins.append(int(row['Bin']))
+            rates.append(float(row['Rate']))
+    expected = numbits // multiplier
+    if len(rates) != expected:
+        raise ValueError(f"Recombination map {filename} has {len(rates)} rows, but the genome has {expected} bins")
+    if bins != list(range(expected)):
+        raise ValueError(f"Recombination map {filename} must list Bin 0 to {expected - 1} in order")
+    if min(rates) < 0:
+        raise ValueError(f"Recombination map {filename} has negative rates")
+    return np.repeat(np.array(rates) / multiplier, multiplier)
+
+# * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * 
+
 def load_actuarial_table():
 
     death_risk = {}
@@ -1141,16 +2101,156 @@ def load_actuarial_table():
 
 # * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * 
 
-def setup_free_params(model):
+def load_hazard_table(death_risk, model, max_lifespan):
+
+    # Annual risk of death indexed by [lifespan, relative age group], scaled so that longer-lived people age more slowly.
+    # Age groups 0-17 are the 5-year rows of the actuarial table, 18 is the risk for young children (0 < age < 5)
+    risks = np.array([death_risk[age_group] for age_group in range(0, 90, 5)] + [death_risk[1]])
+    risk_modification = model["min_lifespan"] / np.maximum(np.arange(max_lifespan + 1), 1)
+    hazard_table = risk_modification[:, np.newaxis] * risks[np.newaxis, :]
+
+    return hazard_table
+
+# * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * 
+
+class RandomStreams:
+
+    # Independent numpy Generators for each phase of a run, all spawned from the run's SeedSequence, so the draws of one
+    # phase never shift those of another. uniform() hands out uniforms from a pre-drawn block per phase.
+    phases = ('population', 'mating', 'meiosis', 'mutation', 'mortality')
+
+    def __init__(self, run_seed):
+        self.buffers = {}
+        for phase, seed in zip(self.phases, run_seed.spawn(len(self.phases))):
+            generator = np.random.default_rng(seed)
+            setattr(self, phase, generator)
+            self.buffers[phase] = DrawBuffer(generator.random, generator.bit_generator)
+
+    def uniform(self, phase, n):
+        return self.buffers[phase].take(n)
+
+# * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * 
+
+class DrawBuffer:
+
+    # Hands out draws from a pre-drawn block, refilled from fill(size) when it runs dry. The generator state before
+    # each refill is kept, so a checkpoint can store where the block came from instead of the block itself.
+    def __init__(self, fill, bit_generator, block_size=65536):
+        self.fill = fill
+        self.bit_generator = bit_generator
+        self.block_size = block_size
+        self.buffer = np.empty(0)
+        self.next = 0
+        self.carry = np.empty(0)    # draws left over from the previous block, at the head of this one
+        self.fill_state, self.fill_size = None, 0
+
+    def take(self, n):
+        if self.next + n > len(self.buffer):
+            self.carry = self.buffer[self.next:].copy()
+            self.fill_state, self.fill_size = self.bit_generator.state, max(n, self.block_size)
+            self.buffer = np.concatenate((self.carry, self.fill(self.fill_size)))
+            self.next = 0
+        draws = self.buffer[self.next:self.next + n]
+        self.next += n
+        return draws
+
+    def saved(self):
+        return self.carry, {'fill_state': self.fill_state, 'fill_size': self.fill_size, 'next': self.next}
+
+    def restore(self, carry, state):
+        # Draws the block again from its saved generator state, leaving the generator where it was
+        self.carry, self.fill_state, self.fill_size, self.next = carry, state['fill_state'], state['fill_size'], state['next']
+        self.buffer = carry
+        if self.fill_state is not None:
+            current = self.bit_generator.state
+            self.bit_generator.state = self.fill_state
+            self.buffer = np.concatenate((carry, self.fill(self.fill_size)))
+            self.bit_generator.state = current
+
+# * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * 
+
+def setup_free_params(model, run_seed):
 
     free_params = {}
+    free_params["rng"] = RandomStreams(run_seed)
     free_params["innoculated"] = {}
     free_params["indID"] = model["start_pop_size"] - 1
     free_params["lastpopsize"] = model["start_pop_size"]
     free_params["mutID"] = 0
-    free_params["seed"] = []
+    free_params["seed"] = -1
+    free_params["hazard_table"] = np.zeros((0, 19))
+    free_params["cumulative_hazards"] = {}    # lifespan -> cumulative hazard by age, for the event engine
+    free_params["mutation_effects"] = MutationEffectSampler(model, free_params["rng"])
     return free_params
 
+# * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * *
+
+class OutputWriter:
+
+    # Appends to a run's output files from a background thread, so disk I/O overlaps with the next simulated year.
+    # Files are opened once and stay open for the run. The queue is bounded, so a slow disk holds the run back
+    # instead of filling memory.
+    def __init__(self, max_pending=64):
+        self.files = {}
+        self.archives = {}    # genome archive directory -> people and carriers written so far
+        self.pending = queue.Queue(max_pending)
+        self.error = None
+        self.thread = threading.Thread(target=self.work, daemon=True)
+        self.thread.start()
+
+    def write(self, filename, text):
+        if self.error:
+            raise self.error
+        if text:
+            self.pending.put((filename, text))
+
+    def writerows(self, filename, rows):
+        text = io.StringIO()
+        csv.writer(text).writerows(rows)
+        self.write(filename, text.getvalue())
+
+    def work(self):
+        while True:
+            filename, text = self.pending.get()
+            try:
+                if filename is None:
+                    return
+                if text is None:    # sync(): everything before this point goes to the OS
+                    for file in self.files.values():
+                        file.flush()
+                    continue
+                if filename not in self.files:
+                    self.files[filename] = open(filename, mode='ab') if isinstance(text, bytes) else open(filename, mode='a', newline='')
+                self.files[filename].write(text)
+            except Exception as error:    # kept for the run to raise; the queue is still drained so it never blocks
+                self.error = self.error or error
+            finally:
+                self.pending.task_done()
+
+    def sync(self):
+        # Flushes the files once the writer gets this far, without waiting for it, so a killed run loses little
+        if self.error:
+            raise self.error
+        self.pending.put(('', None))
+
+    def flush(self):
+        # Waits until everything handed over so far is on disk
+        self.pending.join()
+        for file in self.files.values():
+            file.flush()
+        if self.error:
+            raise self.error
+
+    def close(self):
+        self.pending.join()
+        self.pending.put((None, None))
+        self.thread.join()
+        for file in self.files.values():
+            file.close()
+        self.files = {}
+        if self.error:
+            raise self.error
+
 # * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * 
 
 def setup_output_files(model, run):
@@ -1162,14 +2262,23 @@ def setup_output_files(model, run):
 
     model_name = model['model_id']
     filename = os.path.join(results_directory, f"{model_name}-{run} results.csv")
-    headers = ['run', 'year', 'numinds', 'marriages', 'births', 'random_deaths', 'culled_deaths', 'genetic', 'genealo', 'Y', 'mt', 'cents', 'numblocks', 'avblocksize', 'sdblocksize', 'AvFitPerInd', 'AvBinFit', 'NumMuts', 'AvMutsPerInd', 'AvMutsPerBin']
+    headers = ['run', 'year', 'numinds', 'marriages', 'births', 'random_deaths', 'culled_deaths', 'genetic', 'genealo', 'Y', 'mt', 'cents', 'numblocks', 'avblocksize', 'sdblocksize', 'AvFitPerInd', 'AvBinFit', 'NumMuts', 'AvMutsPerInd', 'AvMutsPerBin', 'SeedRetained', 'SeedCoverage', 'Heterozygosity']
     create_csv(filename, headers)
 
-    if model["track_dead"]:
-        filename = os.path.join(results_directory, f"{model_name}-{run} deaths.csv")
-        headers = ['ID', 'birthyear', 'deathyear', 'sex', 'father', 'mother', 'lifespan', 'lat', 'lon', 'married', 'numbirths', 'Ygens', 'MTgens', 'MinGenealGens', 'MaxGenealGens', 'SeedAlleles', 'CentromereCount', 'blocks', 'fitness', 'NumMuts', 'CauseOfDeath']
+    if model["track_DNA"] and model["chromosome_stats"]:
+        filename = os.path.join(results_directory, f"{model_name}-{run} chromosome_stats.csv")
+        headers = ['run', 'year', 'chromosome', 'SeedRetained', 'SeedCoverage', 'Heterozygosity']
         create_csv(filename, headers)
 
+    if model["track_dead"] and model["death_log"] == 'Binary':
+        create_death_log(os.path.join(results_directory, f"{model_name}-{run} deaths.npy"))
+    elif model["track_dead"]:
+        filename = os.path.join(results_directory, f"{model_name}-{run} deaths.csv")
+        create_csv(filename, DEATH_RECORD.names)
+
+    if model["track_DNA"] and model["genome_snapshots"]:
+        create_genome_archive(os.path.join(results_directory, f"{model_name}-{run} genomes"))
+
     if model["mutation_hist"]:
         filename = os.path.join(results_directory, f"{model_name}-{run} mutation_histogram.csv")
         headers = ['Effect','All','EndOfRun']
@@ -1177,6 +2286,127 @@ def setup_output_files(model, run):
 
 # * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * 
 
+DASHBOARD_SECONDARY = ['perc_seed_genome_retained', 'av_seed_genome_coverage', 'av_heterozygosity', 'av_fitness_per_ind', 'av_fitness_per_bin']     # these are generally not larger than 1.0, so they go on the second y axis
+DASHBOARD_FRAME_TIME = 0.2      # seconds between redraws of the viewer
+DASHBOARD_MAX_PEOPLE = 50000    # larger populations are thinned out on the geography plot
+
+class Dashboard:
+
+    # Live plot of one run, drawn by a separate viewer process (python DRIFT1.py --dashboard) so that the simulation
+    # never waits on rendering. New points go to a feeder thread, which pickles them down the viewer's stdin.
+    def __init__(self, title, plot, geography, history):
+        self.open = True
+        self.process = subprocess.Popen([sys.executable, os.path.abspath(__file__), '--dashboard'], stdin=subprocess.PIPE)
+        self.pending = queue.Queue()
+        self.thread = threading.Thread(target=self.feed, daemon=True)
+        self.thread.start()
+        history = {variable: list(values) for variable, values in history.items()}    # a resumed run starts with its plot so far
+        self.send({'title': title, 'plot': plot, 'geography': geography, 'history': history})
+
+    def send(self, message):
+        if self.open:
+            self.pending.put(message)
+
+    def feed(self):
+        while True:
+            message = self.pending.get()
+            try:
+                if message is None:
+                    self.process.stdin.close()
+                    return
+                pickle.dump(message, self.process.stdin, protocol=pickle.HIGHEST_PROTOCOL)
+                self.process.stdin.flush()
+            except OSError:    # the window was closed; the run carries on without it
+                self.open = False
+                return
+
+    def close(self):
+        # The viewer keeps its windows open after the run, until the user closes them
+        self.send(None)
+        self.thread.join()
+
+def run_dashboard(source):
+
+    # The viewer end of Dashboard: a reader thread collects the points, and the windows are updated at their own pace
+    import matplotlib.pyplot as plt
+    messages = queue.Queue()
+
+    def read():
+        try:
+            while True:
+                messages.put(pickle.load(source))
+        except (EOFError, OSError, pickle.UnpicklingError):
+            messages.put(None)
+
+    threading.Thread(target=read, daemon=True).start()
+    setup = messages.get()
+    if setup is None:
+        return
+    history = setup['history']
+    years = list(history.get('year', []))
+    fig, ax1 = plt.subplots()
+    ax2 = ax1.twinx()
+    fig.canvas.manager.set_window_title(setup['title'])
+    data, lines = {}, {}
+    for variable in setup['plot']:
+        data[variable] = [float(value) for value in history.get(variable, [])]
+        if variable in DASHBOARD_SECONDARY:
+            lines[variable], = ax2.plot([], [], label=variable, linestyle='dashed')
+        else:
+            lines[variable], = ax1.plot([], [], label=variable)
+    ax1.set_xlabel('Year')
+    ax1.legend(loc='upper left')
+    if ax2.lines:
+        ax2.legend(loc='upper right')
+
+    scatter, people = None, None
+    if setup['geography']:
+        geo_fig, geo_ax = plt.subplots()
+        geo_fig.canvas.manager.set_window_title(setup['title'] + ' geography')
+        scatter = geo_ax.scatter([], [], s=4, label='Individuals')
+        geo_ax.add_patch(plt.Circle((0, 0), 0.5, edgecolor='r', facecolor='none', linestyle='dashed'))
+        geo_ax.set_xlim(-0.6, 0.6)
+        geo_ax.set_ylim(-0.6, 0.6)
+        geo_ax.set_xlabel('Latitude')
+        geo_ax.set_ylabel('Longitude')
+        geo_ax.set_title('Geographical Locations of Individuals')
+        geo_ax.legend()
+
+    finished, changed = False, True
+    while plt.get_fignums():
+        # Take everything that has arrived since the last frame; only the newest geography is drawn
+        while not finished:
+            try:
+                message = messages.get_nowait()
+            except queue.Empty:
+                break
+            if message is None:
+                finished = True
+                break
+            years.append(message['year'])
+            for variable, value in message['values'].items():
+                data[variable].append(value)
+            if message['geography'] is not None:
+                people = message['geography']
+            changed = True
+        if changed:
+            for variable, line in lines.items():
+                line.set_data(years, data[variable])
+            for axis in (ax1, ax2):
+                axis.relim()
+                axis.autoscale_view()
+            if scatter is not None and people is not None:
+                scatter.set_offsets(people)
+            for number in plt.get_fignums():
+                plt.figure(number).canvas.draw_idle()
+            changed = False
+        if finished:
+            plt.show()
+            break
+        plt.pause(DASHBOARD_FRAME_TIME)
+
+# * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * 
+
 def setup_plot(model):
 
     things_to_plot_during_run = {}
@@ -1187,5 +2417,47 @@ def setup_plot(model):
 
 # * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * 
 
+def load_default_model():
+
+    # The model as the GUI starts it: every parameter at its default, first option of each dropdown, nothing plotted
+    model = {'plot': []}
+    with open(os.path.join(data_directory, 'parameter_defaults.csv'), newline='') as file:
+        for row in csv.DictReader(file):
+            model[row['parameter']] = parameter_value(row, row['default'])
+    return model
+
+def parameter_value(row, value):
+
+    if row['type'] == 'Dropdown':
+        return value.split(',')[0]
+    if row['type'] == 'Check' or row['value_format'] == 'int':
+        return int(value)
+    if row['value_format'] == 'float':
+        return float(value)
+    return value
+
+# * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * *
+
+def load_parameter_file(filename):
+
+    # A file laid out like parameter_defaults.csv; only the parameter and default columns are needed, and any
+    # parameter it leaves out keeps its default
+    model = load_default_model()
+    with open(os.path.join(data_directory, 'parameter_defaults.csv'), newline='') as file:
+        rows = {row['parameter']: row for row in csv.DictReader(file)}
+    with open(filename, newline='') as file:
+        for row in csv.DictReader(file):
+            if row['parameter'] not in rows:
+                raise ValueError(f"Unknown parameter in {filename}: {row['parameter']}")
+            model[row['parameter']] = parameter_value(rows[row['parameter']], row['default'])
+    return model
+
+# * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * *
+
 if __name__ == "__main__":
-    run_population_model()
+    if sys.argv[1:] == ['--dashboard']:
+        run_dashboard(sys.stdin.buffer)
+    else:
+        # Headless: python DRIFT1.py [parameter file]
+        model = load_parameter_file(sys.argv[1]) if len(sys.argv) > 1 else load_default_model()
+        run_population_model(model, plotting=False)
@@ -24,16 +24,17 @@ class PopulationModelingApp:
         self.plot_states = {}
         self.check_var_dict = {}
 
+        last_rows = {}
         for frame_name, info in frame_info.items():
             frame = self.create_parameter_frame(master, info['title'], info['placement'])
             setattr(self, frame_name, frame)
-            self.populate_frame(frame, self.initial_parameter_states, info['group'])
+            last_rows[frame_name] = self.populate_frame(frame, self.initial_parameter_states, info['group'])
 
         self.toggle_frames()
         self.update_plot_variables()
-        tk.Label(self.main_parameter_frame, text="All Set?", font=tkFont.Font(size=12, weight="bold")).grid(row=32, column=0, columnspan=4)
+        tk.Label(self.main_parameter_frame, text="All Set?", font=tkFont.Font(size=12, weight="bold")).grid(row=last_rows['main_parameter_frame'] + 7, column=0, columnspan=4)
         self.run_button = tk.Button(self.main_parameter_frame, text="Run Model", command=lambda: self.run_model(self.parameter_states, self.plot_states, self.initial_parameter_states, self.check_var_dict))
-        self.run_button.grid(row=33, column=0, columnspan=4, pady=(10, 10))
+        self.run_button.grid(row=last_rows['main_parameter_frame'] + 8, column=0, columnspan=4, pady=(10, 10))
         self.run_button.config(state="normal", bg="green", fg="white")
 
     def create_parameter_frame(self, master, title, placement):
@@ -50,6 +51,7 @@ class PopulationModelingApp:
         return frame
 
     def populate_frame(self, frame, states, group):
+        # returns the row of the spacer below the widgets, so later widgets can go underneath
         widget_row = 2
         for key, value in states.items():
             if value.get("group") == group:
@@ -77,6 +79,7 @@ class PopulationModelingApp:
                     dropdown.grid(row=widget_row, column=1)
                     self.parameter_states[key] = dropdown
                     widget_row += 1
+        last_row = widget_row
         widget_row = 2
         for key, value in self.initial_plot_states.items():
             if value.get("group") == group:
@@ -89,7 +92,9 @@ class PopulationModelingApp:
                     check.select()
                 self.check_var_dict[key] = var
                 widget_row += 1
-        tk.Label(frame, text='').grid(row=25, column=0, columnspan=4)
+        last_row = max(last_row, widget_row, 25)
+        tk.Label(frame, text='').grid(row=last_row, column=0, columnspan=4)
+        return last_row
 
     def toggle_frames(self):
         if self.check_var_dict['track_DNA'].get():
@@ -164,7 +169,9 @@ class PopulationModelingApp:
         self.run_button.config(state="normal", bg="green")
 
 # * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * 
-root = tk.Tk()
-root.geometry("900x750") # width x height
-app = PopulationModelingApp(root)
-root.mainloop()
\ No newline at end of file
+# Guarded so that worker processes started with spawn (e.g. on Windows) can import this module without opening a window
+if __name__ == "__main__":
+    root = tk.Tk()
+    root.geometry("900x800") # width x height
+    app = PopulationModelingApp(root)
+    root.mainloop()
\ No newline at end of file
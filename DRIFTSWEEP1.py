@@ -0,0 +1,142 @@
+import os
+import sys
+import csv
+import json
+import hashlib
+import itertools
+import multiprocessing
+import numpy as np
+from DRIFT1 import load_default_model, load_model_tables, simulate_run, results_directory
+
+# Runs every combination of a parameter sweep on a process pool and collects the results of every run into one table.
+#
+#   python DRIFTSWEEP1.py sweep.json
+#
+# The sweep file is JSON:
+#   "name":       prefix of the output files (default "sweep")
+#   "processes":  number of worker processes (default: all cores)
+#   "base":       values applied to every configuration, over Data/parameter_defaults.csv
+#   "grid":       parameter -> list of values; every combination is run
+#   "configs":    list of parameter -> value overrides, each combined with every grid point
+#
+# e.g. {"base": {"num_runs": 5, "end_year": 500}, "grid": {"max_pop_size": [200, 500], "mu": [1, 5]},
+#       "configs": [{"random_mating": 1}, {"random_mating": 0.2, "selection": "birth"}]}
+#
+# Each configuration gets a short hash of its parameters, used as its model_id, so the usual per-run files do not collide.
+# "{name} configs.csv" lists the parameters of every configuration, and "{name} results.csv" holds the results of every
+# (config, run, year) in long format, appended as each run finishes. Runs use the same random streams as DRIFT1 would
+# for the same random_seed, so any row can be reproduced by running that configuration on its own. Configurations left
+# at random_seed 0 each get their own seed, drawn from one fresh sweep seed that is printed, and written to the
+# random_seed column of "{name} configs.csv" before the configuration is hashed, so repeated configurations stay apart.
+
+# * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * *
+
+def expand_sweep(sweep):
+
+    grid = sweep.get('grid', {})
+    names = list(grid)
+    configs = []
+    for overrides in sweep.get('configs', [{}]):
+        for values in itertools.product(*[grid[name] for name in names]):
+            config = dict(sweep.get('base', {}))
+            config.update(overrides)
+            config.update(zip(names, values))
+            configs.append(config)
+    return configs
+
+def config_hash(model):
+
+    text = json.dumps({key: value for key, value in model.items() if key != 'model_id'}, sort_keys=True)
+    return hashlib.sha1(text.encode()).hexdigest()[:10]
+
+def expected_cost(model):
+
+    # Relative run time: population-years, heavier when genomes or mutations are tracked
+    return model['max_pop_size'] * model['end_year'] * (1 + 2 * model['track_DNA'] + 2 * model['track_mutations'])
+
+# * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * *
+
+def run_sweep(sweep):
+
+    name = sweep.get('name', 'sweep')
+    defaults = load_default_model()
+    root_seed = np.random.SeedSequence()
+    print("Random seed: ", root_seed.entropy)
+    fresh_seeds = np.random.default_rng(root_seed)
+    models = {}
+    for config in expand_sweep(sweep):
+        unknown = set(config) - set(defaults)
+        if unknown:
+            raise ValueError(f"Unknown parameters in sweep: {sorted(unknown)}")
+        model = dict(defaults)
+        model.update(config)
+        if not model['random_seed']:
+            model['random_seed'] = int(fresh_seeds.integers(1, 2**63))
+        model['model_id'] = config_hash(model)
+        models[model['model_id']] = model
+
+    # Tables are loaded once per distinct genome setup, before the workers are forked
+    tables = {}
+    for model in models.values():
+        key = (model['multiplier'], model['recombination_map'])
+        if key not in tables:
+            tables[key] = load_model_tables(model)
+
+    jobs = []
+    for model_id, model in models.items():
+        run_seeds = np.random.SeedSequence(model['random_seed']).spawn(model['num_runs'])
+        jobs += [(model_id, run, run_seeds[run - 1]) for run in range(1, model['num_runs'] + 1)]
+    jobs.sort(key=lambda job: expected_cost(models[job[0]]), reverse=True)
+    print(f"{len(models)} configurations, {len(jobs)} runs")
+
+    save_configs(name, models, defaults)
+    filename = os.path.join(results_directory, f"{name} results.csv")
+    methods = multiprocessing.get_all_start_methods()
+    context = multiprocessing.get_context('fork' if 'fork' in methods else None)
+    with open(filename, 'w', newline='') as file, \
+         context.Pool(sweep.get('processes', os.cpu_count()), initializer=set_sweep, initargs=(models, tables)) as pool:
+        writer = None
+        for done, (model_id, run, headers, rows) in enumerate(pool.imap_unordered(sweep_run, jobs, chunksize=1), 1):
+            if writer is None:
+                writer = csv.writer(file)
+                writer.writerow(['config', 'run', 'year'] + headers)
+            writer.writerows([model_id, run] + row for row in rows)
+            file.flush()
+            print(f"{done}/{len(jobs)}: config {model_id} run {run}")
+    print('Done')
+
+# * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * *
+
+def save_configs(name, models, defaults):
+
+    # Only the parameters that differ from the defaults in some configuration, and always the seed
+    swept = sorted({key for model in models.values() for key in model if key != 'model_id' and model[key] != defaults[key]} | {'random_seed'})
+    with open(os.path.join(results_directory, f"{name} configs.csv"), 'w', newline='') as file:
+        writer = csv.writer(file)
+        writer.writerow(['config'] + swept)
+        for model_id, model in models.items():
+            writer.writerow([model_id] + [model[key] for key in swept])
+
+# * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * *
+
+sweep_state = {}
+
+def set_sweep(models, tables):
+    sweep_state['models'], sweep_state['tables'] = models, tables
+
+def sweep_run(job):
+
+    model_id, run, run_seed = job
+    model = sweep_state['models'][model_id]
+    simulate_run(model, sweep_state['tables'][(model['multiplier'], model['recombination_map'])], run, run_seed, plotting=False)
+    with open(os.path.join(results_directory, f"{model_id}-{run} results.csv"), newline='') as file:
+        reader = csv.reader(file)
+        headers = next(reader)[2:]
+        rows = [row[1:] for row in reader]    # year onwards; the run is already part of the key
+    return model_id, run, headers, rows
+
+# * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * * *
+
+if __name__ == "__main__":
+    with open(sys.argv[1]) as file:
+        run_sweep(json.load(file))
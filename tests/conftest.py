@@ -0,0 +1,33 @@
+import os
+import sys
+import numpy as np
+import pytest
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO)
+
+import DRIFT1
+
+
+@pytest.fixture
+def drift(tmp_path, monkeypatch):
+    # DRIFT1 reading the repo's Data directory and writing its results to a temporary one
+    monkeypatch.setattr(DRIFT1, 'data_directory', os.path.join(REPO, 'Data'))
+    monkeypatch.setattr(DRIFT1, 'results_directory', str(tmp_path))
+    return DRIFT1
+
+
+@pytest.fixture
+def small_model(drift):
+    model = drift.load_default_model()
+    model.update(model_id='test', start_pop_size=60, max_pop_size=60, end_year=60, save_interval=20, random_seed=5)
+    return model
+
+
+def restore_checkpoint(drift, model, tables, filename):
+    # The population, genomes and mutations of a run as its checkpoint saved them
+    IndData, chromosomes, mutations = drift.PopulationStore(), drift.GenomeStore(tables['numbits']), {}
+    free_params = drift.setup_free_params(model, np.random.SeedSequence(model['random_seed']))
+    free_params['numbits'] = tables['numbits']
+    drift.load_checkpoint(filename, model, 1, IndData, chromosomes, mutations, free_params)
+    return IndData, chromosomes, mutations
@@ -0,0 +1,49 @@
+import os
+import numpy as np
+from PIL import Image
+
+from conftest import restore_checkpoint
+
+
+def test_genome_map_rows_are_in_id_order(drift, small_model, tmp_path):
+    # A run long enough for the dead to free storage rows that the newborn reuse
+    model = dict(small_model, track_DNA=1, seed_year=0, checkpoint_interval=60)
+    tables = drift.load_model_tables(model)
+    drift.simulate_run(model, tables, 1, np.random.SeedSequence(model['random_seed']), plotting=False)
+    IndData, chromosomes, _ = restore_checkpoint(drift, model, tables, os.path.join(tmp_path, 'test-1 checkpoint.npz'))
+    ids = IndData.living_ids()
+    assert not np.array_equal(ids, np.sort(ids))
+
+    drift.save_population_genome_map('map', tables['numbits'], IndData, chromosomes, tables['chromosome_arm_data'])
+
+    # One row per chromosome copy, oldest person first: red where the bin holds seed DNA
+    expected = []
+    for ind in sorted(ids.tolist()):
+        for copy in range(2):
+            bits = np.zeros(tables['numbits'], dtype=np.uint8)
+            if ind in chromosomes.row_of:
+                bits = np.unpackbits(chromosomes.haplotypes[chromosomes.row_of[ind] + copy], count=tables['numbits'])
+            expected.append(bits)
+    header = drift.chromosome_map_header(tables['numbits'], tables['chromosome_arm_data'])
+    expected = np.concatenate([header, drift.MAP_COLOURS[np.array(expected)]])
+    image = np.asarray(Image.open(os.path.join(tmp_path, 'map genome_map.png')))
+    assert np.array_equal(image, expected)
+
+
+def test_genome_map_of_extinct_population(drift, small_model, tmp_path):
+    tables = drift.load_model_tables(small_model)
+    drift.save_population_genome_map('empty', tables['numbits'], drift.PopulationStore(), drift.GenomeStore(tables['numbits']), tables['chromosome_arm_data'])
+    image = Image.open(os.path.join(tmp_path, 'empty genome_map.png'))
+    assert image.size == (tables['numbits'], 10)
+
+
+def test_archived_genome_map_matches_the_saved_map(drift, small_model, tmp_path):
+    model = dict(small_model, track_DNA=1, seed_year=0, genome_snapshots=1, every_genome_map=1)
+    tables = drift.load_model_tables(model)
+    drift.simulate_run(model, tables, 1, np.random.SeedSequence(model['random_seed']), plotting=False)
+    archive = drift.GenomeArchive(os.path.join(tmp_path, 'test-1 genomes'))
+    assert archive.years == [0, 20, 40, 60]
+    for year in archive.years:
+        archive.save_genome_map(year, os.path.join(tmp_path, f'archived-{year}'), tables['chromosome_arm_data'])
+        saved = np.asarray(Image.open(os.path.join(tmp_path, f'test-{year} genome_map.png')))
+        assert np.array_equal(np.asarray(Image.open(os.path.join(tmp_path, f'archived-{year}.png'))), saved)
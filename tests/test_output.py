@@ -0,0 +1,30 @@
+import os
+import pytest
+
+
+def test_writer_error_is_raised_instead_of_blocking(drift, tmp_path):
+    output = drift.OutputWriter(max_pending=2)
+    filename = os.path.join(tmp_path, 'out.csv')
+    output.write(filename, 'a,b\r\n')
+    output.write(filename, b'bytes into a text file')    # fails on the writer thread
+    with pytest.raises(TypeError):
+        for _ in range(10):
+            output.write(filename, 'c,d\r\n')
+        output.close()
+    with pytest.raises(TypeError):
+        output.close()    # the files are still closed, keeping what was written before the error
+    with open(filename) as file:
+        assert file.read().startswith('a,b')
+
+
+def test_failed_run_keeps_its_saved_rows_and_error(drift, small_model, tmp_path, monkeypatch):
+    def fail(model, IndData, year):
+        raise RuntimeError('failed in year %d' % year)
+
+    tables = drift.load_model_tables(small_model)
+    original = drift.list_availables
+    monkeypatch.setattr(drift, 'list_availables', lambda model, IndData, year: fail(model, IndData, year) if year == 45 else original(model, IndData, year))
+    with pytest.raises(RuntimeError, match='year 45'):
+        drift.simulate_run(small_model, tables, 1, drift.np.random.SeedSequence(5), plotting=False)
+    with open(os.path.join(tmp_path, 'test-1 results.csv')) as file:
+        assert [line.split(',')[1] for line in file.read().splitlines()[1:]] == ['0', '20', '40']
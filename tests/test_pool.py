@@ -0,0 +1,27 @@
+import os
+import numpy as np
+
+
+def read_results(directory, model_id, runs):
+    results = {}
+    for run in range(1, runs + 1):
+        with open(os.path.join(directory, f"{model_id}-{run} results.csv")) as file:
+            results[run] = file.read()
+    return results
+
+
+def test_spawned_pool_matches_sequential_runs(drift, small_model, tmp_path, monkeypatch):
+    # Spawned workers import DRIFT1 afresh, so they use the relative data and results directories of the working directory
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(drift, 'results_directory', 'results')
+    os.mkdir('results')
+    os.symlink(drift.data_directory, 'data')
+    model = dict(small_model, num_runs=2, processes=2)
+    tables = drift.load_model_tables(model)
+    run_seeds = np.random.SeedSequence(model['random_seed']).spawn(model['num_runs'])
+
+    drift.run_in_pool(dict(model, model_id='pool'), tables, run_seeds, start_method='spawn')
+    for run in (1, 2):
+        drift.simulate_run(dict(model, model_id='sequential'), tables, run, run_seeds[run - 1], plotting=False)
+
+    assert read_results('results', 'pool', 2) == read_results('results', 'sequential', 2)